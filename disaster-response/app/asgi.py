@@ -0,0 +1,186 @@
+# asynchronous (ASGI) entry point of the web app, e.g. `uvicorn asgi:app` inside the app directory or `python asgi.py`
+# - the server runs in one process. Its lifespan starts the inference pool once (DR_INFERENCE_WORKERS), so the CPU-bound predictions
+#   run in the workers of the pool while the event loop keeps accepting requests
+# - POST /api/classify waits for the pool without holding a thread, so the number of concurrent requests is only bounded by
+#   DR_INFERENCE_MAX_PENDING, and requests beyond it are shed with 503
+# - all other pages (and /api/classify without a pool) are served by the Flask app of run.py in a thread of the event loop's executor
+import io
+import sys
+import json
+import time
+import asyncio
+
+import run
+from metrics import StageTimer
+from inference_pool import PoolOverloaded
+
+
+def blocking(function, *args):
+    # runs a blocking function (SQL lite, the template rendering, the Flask app) in a thread, so the event loop is not blocked
+    return asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def send_response(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(name.encode("latin1"), str(value).encode("latin1")) for name, value in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, data, headers=()):
+    await send_response(send, status, [("Content-Type", "application/json")] + list(headers), json.dumps(data).encode("utf-8"))
+
+
+async def classify(body):
+    """
+    Classifies the messages of a request to /api/classify in the inference pool, with the prediction cache if it is enabled.
+    The responses are the same as the ones of the Flask endpoint.
+    """
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        payload = {}
+
+    messages, error = run.parse_messages(payload)
+    if error is not None:
+        return 400, {"error": error}, []
+    if len(messages) == 0:
+        return 200, {"results": []}, []
+
+    timer = StageTimer(run.metrics) if run.metrics is not None else None
+    try:
+        if run.prediction_cache is None:
+            to_classify = messages
+            labels, probabilities = await timed_predict(to_classify, timer)
+        else:
+            keys, values, missing = await blocking(run.lookup_cache, messages)
+            to_classify = list(missing.values())
+            if missing:
+                await blocking(run.store_cache, values, missing, *await timed_predict(to_classify, timer))
+            labels, probabilities = [values[key][0] for key in keys], [values[key][1] for key in keys]
+    except PoolOverloaded as error:
+        return 503, {"error": str(error)}, [("Retry-After", "1")]
+
+    if timer is not None:
+        run.metrics.inc("dr_messages_classified_total", len(to_classify))
+    results = await blocking(run.format_results, messages, labels, probabilities)
+    return 200, {"results": results}, [("Server-Timing", timer.server_timing())] if timer is not None and timer.durations else []
+
+
+async def timed_predict(messages, timer):
+    if timer is None:
+        return await run.inference_pool.predict_async(messages)
+    with timer.stage("pool"):
+        return await run.inference_pool.predict_async(messages)
+
+
+def wsgi_environ(scope, body):
+    """
+    Translates the scope of an ASGI request into the environment of a WSGI request.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        key = name if name in ("CONTENT_TYPE", "CONTENT_LENGTH") else "HTTP_" + name
+        value = value.decode("latin1")
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """
+    Runs a WSGI app for one request and returns the status code, the headers and the body of its response.
+    """
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], b"".join(chunks)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                run.start_inference_pool()
+            except Exception as error:
+                await send({"type": "lifespan.startup.failed", "message": str(error)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            run.stop_inference_pool()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """
+    The ASGI application.
+    """
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    body = await read_body(receive)
+    if scope["path"] == "/api/classify" and scope["method"] == "POST" and run.inference_pool is not None:
+        start = time.perf_counter()
+        status, data, headers = await classify(body)
+        if run.metrics is not None:
+            run.metrics.observe("dr_request_seconds", time.perf_counter() - start, endpoint="/api/classify")
+            run.metrics.inc("dr_requests_total", endpoint="/api/classify", status=status)
+        return await send_json(send, status, data, headers)
+
+    await send_response(send, *await blocking(call_wsgi, run.app, wsgi_environ(scope, body)))
+
+
+def main():
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("The asynchronous server needs uvicorn (pip install uvicorn). Any other ASGI server can be used as well, e.g. hypercorn asgi:app.")
+
+    # one server process, the predictions are spread over the DR_INFERENCE_WORKERS workers of the pool
+    uvicorn.run(app, host="127.0.0.1", port=3001)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    - This class coalesces concurrent single-message requests into one vectorized prediction call.
+    - A background thread waits for the first queued message and then keeps collecting messages until either the latency window expires or the batch is full.
+    - Every caller gets back a Future that resolves to the result for its own message, in the same order as the batch passed to the prediction function.
+
+    Parameters:
+        predict_fn (function): function that takes in a list of messages and returns a list with one result per message.
+        max_latency (float): maximum time in seconds that the first message of a batch waits for other messages to join.
+        max_batch_size (int): maximum number of messages that are passed to predict_fn in one call.
+    """
+
+    def __init__(self, predict_fn, max_latency=0.01, max_batch_size=64):
+        self.predict_fn = predict_fn
+        self.max_latency = max_latency
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, message):
+        """
+        Queues a single message for the next batch.
+
+        Parameters:
+            message (str): the message to classify.
+
+        Returns:
+            future (Future): a future that resolves to the result of predict_fn for this message.
+        """
+        future = Future()
+        self._queue.put((message, future))
+        return future
+
+    def predict(self, message, timeout=None):
+        """
+        Queues a single message and blocks until its result is available.
+
+        Parameters:
+            message (str): the message to classify.
+            timeout (float): maximum number of seconds to wait for the result. None waits forever.
+
+        Returns:
+            result: the result of predict_fn for this message.
+        """
+        return self.submit(message).result(timeout)
+
+    def _collect(self):
+        # block until the first message arrives, then wait up to max_latency for more to join
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            messages = [message for message, _ in batch]
+            try:
+                results = self.predict_fn(messages)
+            except Exception as exc:
+                # propagate the failure to every caller of the batch instead of killing the thread
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
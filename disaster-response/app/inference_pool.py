@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PoolOverloaded(Exception):
+    """
+    Raised when the inference pool sheds a request, because too many requests are pending or the result took too long.
+    """
+
+
+def warm_up(task):
+    # runs the task once in a worker, so the worker loads the model before the first request
+    task([""])
+
+
+class InferencePool:
+    """
+    - This pool runs the CPU-bound predictions in separate worker processes, so the request threads of the web server only wait for the result
+      (without holding the GIL) and the server keeps accepting requests while the model is busy.
+    - The workers are started when the pool is created and each loads the model once. The model file is memory mapped, so the workers share its pages.
+      They are spawned as fresh processes instead of forked, so they do not inherit the threads and held locks (e.g. of a running import) of the web server.
+    - At most max_pending requests are queued or running. Further requests are rejected right away with PoolOverloaded (load shedding),
+      and a request whose result takes longer than the timeout is given up, so the latency stays bounded during bursts.
+    - If a worker dies (e.g. killed by the OOM killer), its pending requests fail with PoolOverloaded and the workers are started again with the next request.
+    - predict waits in the calling thread, predict_async in the event loop of an asynchronous server (see asgi.py).
+
+    Parameters:
+        task (function): module level function that takes in a list of messages and returns the predictions. It runs in the workers.
+        n_workers (int): number of worker processes.
+        max_pending (int): maximum number of requests that are queued or running at the same time.
+        timeout (float): maximum number of seconds a request waits for its result.
+    """
+
+    def __init__(self, task, n_workers, max_pending, timeout=10.0):
+        self.task = task
+        self.n_workers = n_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counts = {"accepted": 0, "rejected": 0, "timed_out": 0, "failed": 0, "restarts": 0}
+        self._executor = self._start()
+
+    def _start(self):
+        executor = ProcessPoolExecutor(max_workers=self.n_workers, mp_context=multiprocessing.get_context("spawn"))
+
+        # start the workers and let them load the model now instead of with the first requests (not waited for, so a restart does not block the server)
+        for _ in range(self.n_workers):
+            executor.submit(warm_up, self.task)
+        return executor
+
+    def _restart(self, executor):
+        # several request threads can notice the broken executor at the same time, only the first one replaces it
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = self._start()
+            self._counts["restarts"] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, messages):
+        """
+        Queues the messages for a worker, or raises PoolOverloaded if max_pending requests are already queued or running.
+
+        Returns:
+            future (Future): a future that resolves to the result of the task.
+        """
+        return self._submit(self.task, messages)
+
+    def _submit(self, function, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counts["rejected"] += 1
+                raise PoolOverloaded("Too many pending requests.")
+            self._pending += 1
+
+        try:
+            executor = self._executor
+            try:
+                future = executor.submit(function, *args)
+            except BrokenProcessPool:
+                self._restart(executor)
+                future = self._executor.submit(function, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        with self._lock:
+            self._counts["accepted"] += 1
+        return future
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def predict(self, messages):
+        """
+        Runs the task for the messages in a worker and waits for the result at most timeout seconds.
+
+        Returns:
+            result: the result of the task.
+        """
+        return self._result(self.submit(messages))
+
+    def call(self, function, *args):
+        """
+        Runs another module level function in a worker, e.g. to read an attribute of the model loaded there, and waits for its result like predict.
+
+        Returns:
+            result: the result of the function.
+        """
+        return self._result(self._submit(function, *args))
+
+    def _result(self, future):
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            self._timed_out(future)
+        except BrokenProcessPool:
+            self._failed()
+
+    async def predict_async(self, messages):
+        """
+        Runs the task for the messages in a worker like predict, but waits for the result without blocking the event loop.
+
+        Returns:
+            result: the result of the task.
+        """
+        future = self.submit(messages)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(future)
+        except BrokenProcessPool:
+            self._failed()
+
+    def _timed_out(self, future):
+        # a queued request is dropped, a running one finishes in the background but its result is not used
+        future.cancel()
+        with self._lock:
+            self._counts["timed_out"] += 1
+        raise PoolOverloaded("The prediction took longer than {:.1f}s.".format(self.timeout))
+
+    def _failed(self):
+        # the request was lost with a dead worker, the executor is replaced by the next submit
+        with self._lock:
+            self._counts["failed"] += 1
+        raise PoolOverloaded("A worker of the inference pool stopped, please retry.")
+
+    def stats(self):
+        """
+        Returns the number of workers, the limits, the counts of accepted, rejected, timed out and failed requests and the number of restarts.
+        """
+        with self._lock:
+            return dict(self._counts, workers=self.n_workers, max_pending=self.max_pending, pending=self._pending, timeout=self.timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,107 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """
+    - This registry keeps counters and latency histograms in memory and renders them in the Prometheus text format.
+    - Every metric has a name and a help text, its values are kept per combination of label values (e.g. stage="tokenize").
+    - It is thread safe, so it can be shared by the request threads of the web app and the micro-batcher.
+
+    Parameters:
+        buckets (tuple): upper bounds of the histogram buckets in seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        self._metrics.setdefault(name, ("counter", help_text, {}))
+
+    def histogram(self, name, help_text):
+        self._metrics.setdefault(name, ("histogram", help_text, {}))
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._metrics[name][2]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._metrics[name][2]
+            if key not in series:
+                # one count per bucket plus the +Inf bucket, the sum and the number of observations
+                series[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            histogram = series[key]
+            histogram["buckets"][bisect_left(self.buckets, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, (metric_type, help_text, series) in self._metrics.items():
+                lines.append("# HELP {} {}".format(name, help_text))
+                lines.append("# TYPE {} {}".format(name, metric_type))
+                for key, value in series.items():
+                    if metric_type == "counter":
+                        lines.append("{}{} {}".format(name, format_labels(key), value))
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ("+Inf",), value["buckets"]):
+                        cumulative += count
+                        lines.append("{}_bucket{} {}".format(name, format_labels(key + (("le", str(bound)),)), cumulative))
+                    lines.append("{}_sum{} {}".format(name, format_labels(key), value["sum"]))
+                    lines.append("{}_count{} {}".format(name, format_labels(key), value["count"]))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    values = ('{}="{}"'.format(label, str(value).replace("\\", "\\\\").replace('"', '\\"')) for label, value in key)
+    return "{" + ",".join(values) + "}"
+
+
+class StageTimer:
+    """
+    Times the stages of one request. Every stage is recorded in the stage histogram of the registry and summed per stage name
+    for the Server-Timing header of the response. Stages can be nested, e.g. the label estimators within the classifier.
+
+    Parameters:
+        registry (class): the MetricsRegistry that receives the observations.
+        metric (str): name of the histogram of the stages.
+    """
+
+    def __init__(self, registry, metric="dr_stage_seconds"):
+        self.registry = registry
+        self.metric = metric
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+            self.registry.observe(self.metric, seconds, stage=name, **labels)
+
+    def server_timing(self):
+        """
+        Returns the durations of the stages as the value of a Server-Timing header, e.g. "tokenize;dur=1.250, classifier;dur=3.100".
+        """
+        return ", ".join("{};dur={:.3f}".format(name, seconds * 1000) for name, seconds in self.durations.items())
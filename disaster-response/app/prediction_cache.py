@@ -0,0 +1,137 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def normalize_message(message):
+    """
+    Normalizes a message for the cache, so retweets and forwarded messages that only differ in case or whitespace share one entry.
+    The app classifies the normalized message, so a cached result is always the prediction of the model for it.
+
+    Parameters:
+        message (str): the message as entered by the user.
+
+    Returns:
+        normalized_message (str): the lower case message with single spaces between the words.
+    """
+    return " ".join(message.lower().split())
+
+
+class PredictionCache:
+    """
+    - This cache keeps the predictions of the most recently classified messages in a bounded in-process LRU.
+    - The entries are keyed by a hash of the normalized message and the version of the model, so a changed model never returns stale results.
+    - Optionally a local SQL lite database is used as a second tier that is shared by all workers of the web server.
+    - The number of hits and misses of both tiers is counted for the hit rate.
+
+    Parameters:
+        max_size (int): maximum number of entries in memory.
+        database_filepath (str): optional file path of the shared SQL lite cache. None keeps the cache in memory only.
+    """
+
+    def __init__(self, max_size=10000, database_filepath=None):
+        self.max_size = max_size
+        self.database_filepath = database_filepath
+        self.model_version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "invalidations": 0}
+
+        if database_filepath is not None:
+            conn = self._connection()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS prediction_cache (key TEXT PRIMARY KEY, model_version TEXT, value TEXT, created_at REAL)")
+            conn.commit()
+
+    def _connection(self):
+        # sqlite connections can not be shared between threads, so every thread opens its own
+        if not hasattr(self._local, "conn"):
+            self._local.conn = sqlite3.connect(self.database_filepath, timeout=5)
+        return self._local.conn
+
+    @staticmethod
+    def key(normalized_message, model_version):
+        return hashlib.blake2b("{}\0{}".format(model_version, normalized_message).encode("utf-8"), digest_size=16).hexdigest()
+
+    def set_model_version(self, model_version):
+        """
+        Drops all entries of other model versions once the model changed. The shared database is cleaned by the first worker that notices the change.
+        """
+        if model_version == self.model_version:
+            return
+        with self._lock:
+            if self.model_version is not None:
+                self._counts["invalidations"] += 1
+            self._entries.clear()
+            self.model_version = model_version
+        if self.database_filepath is not None:
+            conn = self._connection()
+            conn.execute("DELETE FROM prediction_cache WHERE model_version != ?", (model_version,))
+            conn.commit()
+
+    def get_many(self, keys):
+        """
+        Looks up the keys in memory and then in the shared database.
+
+        Returns:
+            values (dict): the cached values of the found keys.
+        """
+        values = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    values[key] = self._entries[key]
+            self._counts["memory_hits"] += len(values)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in values]
+        if missing and self.database_filepath is not None:
+            rows = self._connection().execute(
+                "SELECT key, value FROM prediction_cache WHERE key IN ({})".format(", ".join("?" * len(missing))), missing).fetchall()
+            disk_values = {key: json.loads(value) for key, value in rows}
+            self._store(disk_values)
+            values.update(disk_values)
+            with self._lock:
+                self._counts["disk_hits"] += len(disk_values)
+
+        with self._lock:
+            self._counts["misses"] += sum(1 for key in missing if key not in values)
+        return values
+
+    def put_many(self, values):
+        """
+        Stores the values in memory and in the shared database.
+
+        Parameters:
+            values (dict): the values by key, they must be JSON serializable.
+        """
+        self._store(values)
+        if self.database_filepath is not None and values:
+            conn = self._connection()
+            now = time.time()
+            conn.executemany("INSERT OR REPLACE INTO prediction_cache VALUES (?, ?, ?, ?)",
+                             [(key, self.model_version, json.dumps(value), now) for key, value in values.items()])
+            conn.commit()
+
+    def _store(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Returns the counts of hits and misses, the hit rate and the number of entries in memory.
+        """
+        with self._lock:
+            stats = dict(self._counts, size=len(self._entries), max_size=self.max_size, model_version=self.model_version,
+                         shared=self.database_filepath is not None)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else None
+        return stats
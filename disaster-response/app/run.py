@@ -1,97 +1,518 @@
+import os
+import sys
 import json
-import plotly
-import pandas as pd
+import time
+import numpy as np
 import sqlite3
-import re
-
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
+import threading
+from functools import lru_cache
 
 from flask import Flask
-from flask import render_template, request
-from plotly.graph_objs import Bar
-import joblib
+from flask import render_template, request, jsonify, g, has_request_context, Response
+
+from batching import MicroBatcher
+from metrics import MetricsRegistry, StageTimer
+from prediction_cache import PredictionCache, normalize_message
+from inference_pool import InferencePool, PoolOverloaded
+
+# the tokenizer and the custom transformers are shared with the training script in the models folder.
+# They are imported (with sklearn, joblib, NLTK and plotly) by the functions that need them, so a worker of the web server starts quickly
+# and only the process that predicts loads the model.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+from legacy_pickles import main_attribute
 
 
 app = Flask(__name__)
 
-def tokenize(text):
+# file paths of the data and the model, they can be changed with environment variables
+database_filepath = os.environ.get("DR_DATABASE_FILEPATH", "../data/DisasterResponse.db")
+table_name = os.environ.get("DR_TABLE_NAME", "DisasterResponse")
+model_filepath = os.environ.get("DR_MODEL_FILEPATH", "../models/dr_classifier.pkl")
+
+# labels that are not displayed, since they do not hold any prediction power (see README)
+hidden_labels = ["related", "child_alone"]
+
+_model = None
+_model_version = None
+_model_lock = threading.Lock()
+
+# the label names of the model and the version of the model file they were read from
+_category_names = (None, None)
+
+
+def __getattr__(name):
+    """
+    Resolves the tokenizer and the custom transformers of models pickled from the training script's __main__ (see legacy_pickles.py).
+    """
+    return main_attribute(__name__, name)
+
+# optional instrumentation of the prediction path (DR_METRICS=1): stage histograms and counters on /metrics and a Server-Timing header
+metrics = None
+if os.environ.get("DR_METRICS", "0") not in ("", "0"):
+    metrics = MetricsRegistry()
+    metrics.histogram("dr_stage_seconds", "Time spent in each stage of the prediction path.")
+    metrics.histogram("dr_request_seconds", "Time spent handling a request.")
+    metrics.counter("dr_requests_total", "Number of handled requests.")
+    metrics.counter("dr_messages_classified_total", "Number of classified messages.")
+
+
+def get_model_version():
+    """
+    Returns the version of the model file, derived from its modification time and size, so a retrained model is noticed without reading the file.
+    """
+    stat = os.stat(model_filepath)
+    return "{}-{}".format(stat.st_mtime_ns, stat.st_size)
+
+
+def get_model():
+    """
+    Loads the model the first time it is needed instead of at import, so that the workers start quickly.
+    The numpy arrays of the model are memory mapped from the (uncompressed) joblib file, so several workers share the same pages instead of each holding its own copy.
+    When the model file changes (e.g. after a retraining), the new model is loaded with the next request.
+    If the new file can not be loaded yet (e.g. it is still being written), the previous model is kept and the loading is retried later.
+
+    Returns:
+        model (class): the fitted pipeline.
+    """
+    import joblib
+
+    global _model, _model_version
+    version = get_model_version()
+    if _model is None or version != _model_version:
+        with _model_lock:
+            if _model is None or version != _model_version:
+                try:
+                    _model = joblib.load(model_filepath, mmap_mode="r")
+                    _model_version = version
+                except Exception:
+                    if _model is None:
+                        raise
+                    app.logger.exception("Could not load the changed model, keeping the previous one.")
+    return _model
+
+
+def summarize_database():
+    """
+    Computes the dashboard aggregates inside SQL lite, so the messages are never loaded into memory.
+
+    Returns:
+        category_names (list): the labels with more than one category (1/0).
+        genre_counts (dataframe): number of messages with at least one displayed label per genre.
+        label_counts (dataframe): number of messages per displayed label.
+    """
+    import pandas as pd
+
+    conn = sqlite3.connect(database_filepath)
+    try:
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+        label_cols = [col for col in columns if col not in ["id","message","original","genre"]]
+        display_cols = [col for col in label_cols if col not in hidden_labels]
+
+        # labels with only one category (1/0) are not predicted by the model
+        distinct_counts = conn.execute(
+            'SELECT {} FROM "{}"'.format(", ".join(f'COUNT(DISTINCT "{col}")' for col in label_cols), table_name)
+        ).fetchone()
+        category_names = [col for col, count in zip(label_cols, distinct_counts) if count > 1]
+
+        # only messages with at least one displayed label are counted, since they are the ones used for training
+        has_label = "({}) != 0".format(" + ".join(f'"{col}"' for col in display_cols))
+        genre_counts = pd.read_sql_query(
+            f'SELECT genre, COUNT(message) AS count FROM "{table_name}" WHERE {has_label} GROUP BY genre ORDER BY genre', conn)
+        label_sums = conn.execute(
+            'SELECT {} FROM "{}" WHERE {}'.format(", ".join(f'SUM("{col}")' for col in display_cols), table_name, has_label)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    label_counts = pd.DataFrame({'Label': display_cols, 'Number of Messages': [int(total or 0) for total in label_sums]})
+
+    return category_names, genre_counts, label_counts
+
+
+def summarize_parquet():
+    """
+    Computes the dashboard aggregates from the parquet file exported by process_data.py.
+    Only the genre and the uint8 label columns are read, the text columns are never loaded.
+
+    Returns:
+        category_names (list): the labels with more than one category (1/0).
+        genre_counts (dataframe): number of messages with at least one displayed label per genre.
+        label_counts (dataframe): number of messages per displayed label.
+    """
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    label_cols = [col for col in pq.read_schema(database_filepath).names if col not in ["id","message","original","genre"]]
+    display_cols = [col for col in label_cols if col not in hidden_labels]
+    df = pd.read_parquet(database_filepath, columns=["genre"] + label_cols)
+
+    # labels with only one category (1/0) are not predicted by the model
+    category_names = [col for col in label_cols if df[col].nunique() > 1]
+
+    # only messages with at least one displayed label are counted, since they are the ones used for training
+    df = df[df[display_cols].to_numpy().any(axis=1)]
+    genre_counts = df.groupby('genre', observed=True).size().reset_index(name='count')
+    label_counts = pd.DataFrame({'Label': display_cols, 'Number of Messages': df[display_cols].sum().astype(int).tolist()})
+
+    return category_names, genre_counts, label_counts
+
+
+@lru_cache(maxsize=1)
+def get_data_summary():
+    """
+    Computes the aggregates shown on the dashboard once and keeps them for all following page views.
+    The data is read from the SQL lite database or, if DR_DATABASE_FILEPATH points to a .parquet file, from the columnar export.
+
+    Returns:
+        summary (dict):
+            - category_names (list): the labels in the same order as the model predicts them (see load_data in train_classifier.py).
+            - genre_names (list) and genre_counts (list): number of messages per genre.
+            - label_counts (dataframe): number of messages per displayed label, sorted in descending order.
+    """
+    if database_filepath.endswith(".parquet"):
+        category_names, genre_counts, label_counts = summarize_parquet()
+    else:
+        category_names, genre_counts, label_counts = summarize_database()
+
+    return {
+        'category_names': category_names,
+        'genre_names': genre_counts['genre'].astype(str).tolist(),
+        'genre_counts': genre_counts['count'].astype(int).tolist(),
+        'label_counts': label_counts.sort_values('Number of Messages', ascending=False)
+    }
+
+
+def model_category_names():
+    """
+    Returns the labels in the order the loaded model predicts them. Models saved by train_classifier.py carry them (category_names_),
+    for older models they are derived from the data like load_data does.
+    """
+    category_names = getattr(get_model(), 'category_names_', None)
+    return list(category_names) if category_names is not None else get_data_summary()['category_names']
+
+
+def get_category_names():
+    """
+    Returns the label names of the predictions, read again when the model file changes.
+    With the inference pool the model is only loaded by the workers, so the names are read by a worker instead of loading the model here.
+
+    Returns:
+        category_names (list): the labels in the order the model predicts them.
+    """
+    global _category_names
+    version = get_model_version()
+    if _category_names[0] != version:
+        category_names = inference_pool.call(model_category_names) if inference_pool is not None else model_category_names()
+        _category_names = (version, category_names)
+    return _category_names[1]
+
+
+def current_timer():
+    """
+    Returns the stage timer of the current request, or a new one for the calls of the micro-batcher (which run outside of a request).
+    """
+    if has_request_context() and "timer" in g:
+        return g.timer
+    return StageTimer(metrics)
+
+
+def timed_transform(step, X, timer, name="features"):
     """
-    - This function takes in a string, tokenizes it, removes English stop words and applies lemmatization. 
-    - The result is a list of all resulting tokens. 
-    - The function can be passed into a tokenizer of a sklearn transformer so that the input will the string of each row on the dataframe.
+    Computes the features like step.transform(X), timing every branch of a FeatureUnion and the tokenizer on their own.
 
     Parameters:
-        text (str): A single string or if passed into a tokenizer of a sklearn transformer it will treat the string of each row of the dataframe.
+        step (class): a fitted transformer of the model pipeline.
+        X (list): the messages.
+        timer (class): the StageTimer of the request.
+        name (str): the name of the step in the pipeline or the FeatureUnion.
 
-    Return:
-        clean_tokens (list): A list of the resulting tokens for the passed string after the tokenization processing.
+    Returns:
+        features (matrix): the same features as step.transform(X).
     """
-    #tokenize text
-    tokens = word_tokenize(text)
-    
-    #stop word removal
-    tokens = [tok.lower().strip() for tok in tokens if tok not in stopwords.words("english")]
+    from scipy import sparse
+    from sklearn.pipeline import FeatureUnion
+    from features import TokenCountTfidf
 
-    #lemmatization of words
-    lemmatizer = WordNetLemmatizer()
-    lemmatized_tokens = [lemmatizer.lemmatize(tok, pos='v') for tok in tokens]
+    if isinstance(step, FeatureUnion):
+        with timer.stage("features"):
+            blocks = []
+            for branch_name, branch in step.transformer_list:
+                if branch == "drop":
+                    continue
+                block = timed_transform(branch, X, timer, branch_name)
+                if step.transformer_weights and branch_name in step.transformer_weights:
+                    block = block * step.transformer_weights[branch_name]
+                blocks.append(block)
+            if any(sparse.issparse(block) for block in blocks):
+                return sparse.hstack(blocks).tocsr()
+            return np.hstack(blocks)
 
-    #remove tokens that only contain special characters
-    clean_tokens = [tok for tok in lemmatized_tokens if not re.match("^[\W_]+", tok)]
-    
-    #remove tokens that contain digits as they will not be relevant for this supervised learning problem
-    clean_tokens = [tok for tok in clean_tokens if not re.search("\d", tok)]
-    
-    return clean_tokens
+    if isinstance(step, TokenCountTfidf):
+        with timer.stage("tokenize"):
+            tokens = step.analyze(X)
+        with timer.stage("branch", branch=name):
+            return step.transform_tokens(tokens)
 
+    with timer.stage("branch", branch=name):
+        return step.transform(X)
 
-# create a class for a custom transformer to count words in a string
-class WordCounter:
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X):
-        return [[len(text.split())] for text in X]
 
+def timed_predict(classifier, features, timer, category_names):
+    """
+    Predicts the labels like classifier.predict(features), timing every label estimator of a MultiOutputClassifier on its own.
+
+    Returns:
+        labels (array): array of shape (number of messages, number of labels).
+    """
+    with timer.stage("classifier"):
+        if not hasattr(classifier, "estimators_"):
+            return classifier.predict(features)
+
+        columns = []
+        for label, estimator in zip(category_names, classifier.estimators_):
+            with timer.stage("estimator", label=label):
+                columns.append(estimator.predict(features))
+        return np.asarray(columns).T
 
-# create a for custom transformer to measure the length of a string
-class CharacterCounter:
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X):
-        return [[len(text)] for text in X]   
 
-# load data
-database_filepath = "../data/DisasterResponse.db"
-conn = sqlite3.connect(database_filepath)
-df = pd.read_sql_query('SELECT * FROM DisasterResponse', conn)
+def predict_labels(messages):
+    """
+    Predicts the labels of the messages with the model, through the timed stages if the instrumentation is enabled.
+
+    Returns:
+        labels (array): array of shape (number of messages, number of labels).
+    """
+    if inference_pool is not None:
+        return predict_batch(messages)[0]
+
+    model = get_model()
+    if metrics is None:
+        return model.predict(messages)
+
+    timer = current_timer()
+    features = messages
+    for name, step in model.steps[:-1]:
+        features = timed_transform(step, features, timer, name)
+    labels = timed_predict(model[-1], features, timer, get_category_names())
+    metrics.inc("dr_messages_classified_total", len(messages))
+    return labels
 
-# remove rows which do not have any label as they will not provide any prediction
-label_cols = df.drop(["id","message","original","genre","related","child_alone"], axis=1).columns
-df['sum'] = df[label_cols].sum(axis=1)
-df = df[df['sum'] != 0]
-df = df.drop(["sum"], axis=1)
 
-df = df.drop(["related","child_alone"], axis=1)
+def predict_batch(messages):
+    """
+    Predicts the labels and the probabilities of a batch of messages with one vectorized pass through the model.
+    The features are only computed once and shared between the label and the probability predictions.
+
+    Parameters:
+        messages (list): list of strings to classify.
+
+    Returns:
+        labels (array): array of shape (number of messages, number of labels) with the labels (0/1).
+        probabilities (array): array of the same shape with the probability of each label.
+    """
+    if inference_pool is not None:
+        if metrics is None:
+            return inference_pool.predict(messages)
+        with current_timer().stage("pool"):
+            labels, probabilities = inference_pool.predict(messages)
+        metrics.inc("dr_messages_classified_total", len(messages))
+        return labels, probabilities
 
-# load model
-model = joblib.load("../models/dr_classifier.pkl")
+    from gate import positive_probabilities
+
+    model = get_model()
+    category_names = get_category_names()
+    classifier = model[-1]
+
+    if metrics is None:
+        features = model[:-1].transform(messages)
+        labels = classifier.predict(features)
+        probabilities = positive_probabilities(classifier, features)
+    else:
+        timer = current_timer()
+        features = messages
+        for name, step in model.steps[:-1]:
+            features = timed_transform(step, features, timer, name)
+        labels = timed_predict(classifier, features, timer, category_names)
+        with timer.stage("probabilities"):
+            probabilities = positive_probabilities(classifier, features)
+        metrics.inc("dr_messages_classified_total", len(messages))
+
+    return labels, probabilities
+
+
+def predict_in_worker(messages):
+    """
+    Predicts the labels and the probabilities of a batch of messages in a worker process of the inference pool.
+
+    Returns:
+        labels (array): array of shape (number of messages, number of labels) with the labels (0/1).
+        probabilities (array): array of the same shape with the probability of each label.
+    """
+    from gate import positive_probabilities
+
+    model = get_model()
+    features = model[:-1].transform(messages)
+    classifier = model[-1]
+    return np.asarray(classifier.predict(features)), positive_probabilities(classifier, features)
+
+
+def lookup_cache(messages):
+    """
+    Looks up the predictions of the normalized messages in the prediction cache.
+    Only the version of the model file is needed for the keys, so the model is not loaded (with the inference pool only the workers load it).
+
+    Returns:
+        keys (list): the cache key of every message.
+        values (dict): the cached labels and probabilities by key.
+        missing (dict): the normalized messages that still have to be classified by key, every one only once.
+    """
+    model_version = get_model_version()
+    prediction_cache.set_model_version(model_version)
+    keys = [PredictionCache.key(normalize_message(message), model_version) for message in messages]
+    values = prediction_cache.get_many(keys)
+
+    # classify every missing normalized message only once, also if it occurs several times in the batch
+    missing = {key: normalize_message(message) for key, message in zip(keys, messages) if key not in values}
+    return keys, values, missing
+
+
+def store_cache(values, missing, labels, probabilities):
+    """
+    Adds the predictions of the missing messages to the prediction cache and to the values.
+    """
+    new_values = {key: [[int(label) for label in message_labels], [round(float(proba), 4) for proba in message_probabilities]]
+                  for key, message_labels, message_probabilities in zip(missing, labels, probabilities)}
+    prediction_cache.put_many(new_values)
+    values.update(new_values)
+
+
+def cached_predict_batch(messages):
+    """
+    Predicts the labels and the probabilities like predict_batch, but only for the messages that are not in the prediction cache.
+    The messages are normalized first, so messages that only differ in case or whitespace are classified once.
+
+    Returns:
+        labels (list): one list of labels (0/1) per message.
+        probabilities (list): one list of probabilities per message.
+    """
+    keys, values, missing = lookup_cache(messages)
+    if missing:
+        store_cache(values, missing, *predict_batch(list(missing.values())))
+
+    return [values[key][0] for key in keys], [values[key][1] for key in keys]
+
+
+def classify(messages):
+    """
+    Classifies a batch of messages, with the prediction cache if it is enabled.
+
+    Parameters:
+        messages (list): list of strings to classify.
+
+    Returns:
+        results (list): one dictionary per message with the message, its labels (0/1) and the probability of each label.
+    """
+    if prediction_cache is None:
+        labels, probabilities = predict_batch(messages)
+    else:
+        labels, probabilities = cached_predict_batch(messages)
+
+    return format_results(messages, labels, probabilities)
+
+
+def format_results(messages, labels, probabilities):
+    """
+    Returns one dictionary per message with the message, its labels (0/1) and the probability of each label by label name.
+    """
+    category_names = get_category_names()
+    results = []
+    for message, message_labels, message_probabilities in zip(messages, labels, probabilities):
+        results.append({
+            'message': message,
+            'labels': {name: int(label) for name, label in zip(category_names, message_labels)},
+            'probabilities': {name: round(float(proba), 4) for name, proba in zip(category_names, message_probabilities)}
+        })
+
+    return results
+
+
+def parse_messages(payload):
+    """
+    Reads the messages of a request to /api/classify, either {"message": "..."} or {"messages": ["...", "..."]}.
+
+    Returns:
+        messages (list): the messages, or None if the payload is not valid.
+        error (str): the reason why the payload is not valid, or None.
+    """
+    # a JSON list, string or number is valid JSON, but not a request
+    if not isinstance(payload, dict):
+        return None, 'Expected a JSON object with a "message" string or a "messages" list.'
+
+    if "messages" in payload:
+        messages = payload["messages"]
+    elif "message" in payload:
+        messages = [payload["message"]]
+    else:
+        return None, 'Expected a JSON body with a "message" string or a "messages" list.'
+
+    if not isinstance(messages, list) or not all(isinstance(message, str) for message in messages):
+        return None, '"messages" must be a list of strings.'
+
+    return messages, None
+
+
+# optionally cache the predictions of recently classified messages
+# DR_CACHE_SIZE=0 (default) disables the cache, DR_CACHE_DATABASE shares the cache between the workers in a SQL lite file
+cache_size = int(os.environ.get("DR_CACHE_SIZE", 0))
+prediction_cache = PredictionCache(max_size=cache_size, database_filepath=os.environ.get("DR_CACHE_DATABASE")) if cache_size > 0 else None
+
+
+# optionally run the predictions in a pool of worker processes with a bounded number of pending requests
+# DR_INFERENCE_WORKERS=0 (default) predicts in the request thread. The pool is not created at import (the workers and every process
+# of a pre-forking server import this module), but once per server by start_inference_pool (main below or the lifespan of asgi.py)
+inference_workers = int(os.environ.get("DR_INFERENCE_WORKERS", 0))
+inference_pool = None
+
+
+def start_inference_pool():
+    """
+    Starts the inference pool if DR_INFERENCE_WORKERS is set. Called once by the server that owns the pool.
+    """
+    global inference_pool
+    if inference_workers > 0 and inference_pool is None:
+        inference_pool = InferencePool(predict_in_worker, n_workers=inference_workers,
+                                       max_pending=int(os.environ.get("DR_INFERENCE_MAX_PENDING", 4 * inference_workers)),
+                                       timeout=float(os.environ.get("DR_INFERENCE_TIMEOUT_MS", 10000)) / 1000)
+    return inference_pool
+
+
+def stop_inference_pool():
+    global inference_pool
+    if inference_pool is not None:
+        inference_pool.shutdown()
+        inference_pool = None
+
+
+# optionally coalesce concurrent single-message API requests into one predict call
+# DR_BATCH_WINDOW_MS=0 (default) disables the micro-batcher
+batch_window_ms = float(os.environ.get("DR_BATCH_WINDOW_MS", 0))
+batch_max_size = int(os.environ.get("DR_BATCH_MAX_SIZE", 64))
+batcher = MicroBatcher(classify, max_latency=batch_window_ms / 1000, max_batch_size=batch_max_size) if batch_window_ms > 0 else None
 
 
 # index webpage displays cool visuals and receives user input text for model
 @app.route('/')
 @app.route('/index')
 def index():
-    
-    # extract data needed for visuals
-    genre_counts = df.groupby('genre').count()['message']
-    genre_names = list(genre_counts.index)
+    import plotly
+    from plotly.graph_objs import Bar
 
-    label_counts = df[df.columns[4:]].sum().reset_index().rename(columns={'index': 'Label', 0: 'Number of Messages'}).sort_values('Number of Messages', ascending=False)
+    # extract data needed for visuals (computed once and cached)
+    summary = get_data_summary()
+    genre_names = summary['genre_names']
+    genre_counts = summary['genre_counts']
+    label_counts = summary['label_counts']
     
     # create visuals
     # TODO: Below is an example - modify to create your own visuals
@@ -153,8 +574,16 @@ def go():
     query = request.args.get('query', '') 
 
     # use model to predict classification for query
-    classification_labels = model.predict([query])[0]
-    classification_results = dict(zip(df.columns[4:], classification_labels))
+    if prediction_cache is not None:
+        classification_labels = cached_predict_batch([query])[0][0]
+    else:
+        classification_labels = predict_labels([query])[0]
+    category_names = get_category_names()
+    classification_results = {name: label for name, label in zip(category_names, classification_labels) if name not in hidden_labels}
+
+    if metrics is not None:
+        with current_timer().stage("render"):
+            return render_template('go.html', query=query, classification_result=classification_results)
 
     # This will render the go.html Please see that file. 
     return render_template(
@@ -164,8 +593,87 @@ def go():
     )
 
 
+# JSON API that classifies one or many messages per request
+@app.route('/api/classify', methods=['POST'])
+def api_classify():
+    payload = request.get_json(silent=True)
+
+    # accept either {"message": "..."} or {"messages": ["...", "..."]}
+    messages, error = parse_messages(payload)
+    if error is not None:
+        return jsonify(error=error), 400
+
+    if len(messages) == 0:
+        return jsonify(results=[])
+
+    # single messages go through the micro-batcher (if enabled), lists are already a batch
+    if batcher is not None and len(messages) == 1:
+        results = [batcher.predict(messages[0])]
+    else:
+        results = classify(messages)
+
+    return jsonify(results=results)
+
+
+@app.before_request
+def start_timer():
+    if metrics is not None:
+        g.timer = StageTimer(metrics)
+        g.start = time.perf_counter()
+
+
+@app.after_request
+def record_timing(response):
+    if metrics is not None and "timer" in g:
+        seconds = time.perf_counter() - g.start
+        endpoint = request.url_rule.rule if request.url_rule else "unknown"
+        metrics.observe("dr_request_seconds", seconds, endpoint=endpoint)
+        metrics.inc("dr_requests_total", endpoint=endpoint, status=response.status_code)
+
+        # the stages of the request and the total time in ms, e.g. "tokenize;dur=0.810, ..., total;dur=12.400"
+        timings = g.timer.server_timing()
+        response.headers["Server-Timing"] = (timings + ", " if timings else "") + "total;dur={:.3f}".format(seconds * 1000)
+    return response
+
+
+# requests that the inference pool can not take are shed with 503, so the clients retry instead of queueing up
+@app.errorhandler(PoolOverloaded)
+def overloaded(error):
+    if request.path.startswith('/api/'):
+        return jsonify(error=str(error)), 503, {'Retry-After': '1'}
+    return 'The server is busy, please try again in a moment. ({})'.format(error), 503, {'Retry-After': '1'}
+
+
+# health check for load balancers with the state of the inference pool
+@app.route('/api/health')
+def health():
+    return jsonify(status='ok', inference_pool=inference_pool.stats() if inference_pool is not None else None)
+
+
+# hit rate of the prediction cache
+@app.route('/api/cache')
+def cache_stats():
+    if prediction_cache is None:
+        return jsonify(error='The prediction cache is disabled, start the app with DR_CACHE_SIZE > 0.'), 404
+    return jsonify(prediction_cache.stats())
+
+
+# Prometheus endpoint with the metrics of the prediction path (only with DR_METRICS=1)
+@app.route('/metrics')
+def prometheus_metrics():
+    if metrics is None:
+        return Response("Metrics are disabled, start the app with DR_METRICS=1.\n", status=404, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 def main():
-    app.run(host='127.0.0.1', port=3001, debug=True)
+    # development server, see asgi.py for the asynchronous server
+    # the debug reloader would start a second copy of the app with its own inference pool
+    start_inference_pool()
+    try:
+        app.run(host='127.0.0.1', port=3001, debug=inference_pool is None, threaded=True)
+    finally:
+        stop_inference_pool()
 
 
 if __name__ == '__main__':
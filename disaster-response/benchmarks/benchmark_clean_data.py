@@ -0,0 +1,129 @@
+# import libraries
+###################################################################################################################
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(BENCHMARKS_DIR), "data"))
+
+from process_data import load_data, clean_data
+
+# define functions
+###################################################################################################################
+def legacy_clean_data(df):
+    """
+    The original implementation of clean_data (with the label-only replacement of 2s), kept as the reference for the output and the speed of
+    process_data.clean_data.
+
+    Parameters:
+        df (pandas dataframe): merged datasets of messages and categories
+
+    Returns:
+        df (pandas dataframe): cleaned dataset
+    """
+    categories_df = df["categories"].str.split(pat=";", expand=True)
+    categories_df.columns = categories_df.loc[0].apply(lambda x: x[:-2]).tolist()
+
+    for column in categories_df.columns:
+        categories_df[column] = categories_df[column].str[-1]
+        categories_df[column] = categories_df[column].astype(int)
+
+    df = df.drop("categories", axis=1)
+    df = pd.concat([df, categories_df], axis=1)
+    df = df.drop_duplicates()
+
+    for column in categories_df.columns:
+        df = df[df[column].notna()]
+
+    for column in categories_df.columns:
+        df[column] = df[column].replace(2., 1.)
+
+    return df
+
+
+def replicate(df, times):
+    """
+    Returns the merged dataset replicated several times. Every copy gets new ids, so the copies are no duplicates of each other,
+    while the duplicates within the original data are kept in every copy.
+    """
+    offset = df["id"].max()
+    return pd.concat([df.assign(id=df["id"] + i * offset) for i in range(times)], ignore_index=True)
+
+
+def measure(function, df, repeat):
+    """
+    Runs a cleaning function several times on a copy of the data.
+
+    Returns:
+        result (dataframe): the cleaned data of the last run.
+        seconds (float): the fastest run.
+        peak_mb (float): the peak memory allocated during one run in MB, measured with tracemalloc.
+    """
+    seconds = []
+    for _ in range(repeat):
+        data = df.copy()
+        start = time.perf_counter()
+        result = function(data)
+        seconds.append(time.perf_counter() - start)
+        del result
+
+    data = df.copy()
+    tracemalloc.start()
+    result = function(data)
+    peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+
+    return result, min(seconds), peak_mb
+
+
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Compares the vectorized clean_data of process_data.py with the original implementation: output, time and memory.',
+        epilog='Example: python benchmark_clean_data.py ../data/disaster_messages.csv ../data/disaster_categories.csv --replicate 10')
+    parser.add_argument('messages_filename', help='filepath of the messages csv file')
+    parser.add_argument('categories_filename', help='filepath of the categories csv file')
+    parser.add_argument('--replicate', type=int, default=10, help='number of copies of the corpus that are cleaned at once (default 10)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs, the fastest is reported (default 3)')
+    return parser.parse_args()
+
+
+# define main function
+###################################################################################################################
+def main():
+    args = parse_args()
+
+    df = replicate(load_data(args.messages_filename, args.categories_filename), args.replicate)
+    print('Benchmarking clean_data on {} rows ({} copies of the corpus)...'.format(len(df), args.replicate))
+
+    legacy_df, legacy_seconds, legacy_mb = measure(legacy_clean_data, df, args.repeat)
+    clean_df, clean_seconds, clean_mb = measure(clean_data, df, args.repeat)
+
+    print('    legacy clean_data:     {:8.2f}s  {:10.0f} rows/s  peak {:8.1f} MB  labels {:.1f} MB'
+          .format(legacy_seconds, len(df) / legacy_seconds, legacy_mb, legacy_df.iloc[:, 4:].memory_usage(index=False).sum() / 1024 ** 2))
+    print('    vectorized clean_data: {:8.2f}s  {:10.0f} rows/s  peak {:8.1f} MB  labels {:.1f} MB'
+          .format(clean_seconds, len(df) / clean_seconds, clean_mb, clean_df.iloc[:, 4:].memory_usage(index=False).sum() / 1024 ** 2))
+    print('    speed-up: {:.1f}x'.format(legacy_seconds / clean_seconds))
+
+    # check that the output did not change, apart from the compact dtypes of the labels
+    try:
+        pd.testing.assert_frame_equal(clean_df, legacy_df, check_dtype=False)
+    except AssertionError as error:
+        print('    the cleaned data is different:\n{}'.format(error))
+        sys.exit(1)
+    print('    the cleaned data is identical ({} rows, {} columns)'.format(len(clean_df), clean_df.shape[1]))
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
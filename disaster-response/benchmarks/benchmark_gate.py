@@ -0,0 +1,147 @@
+# import libraries
+###################################################################################################################
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import recall_score, f1_score
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(BENCHMARKS_DIR), "models"))
+
+from train_classifier import load_data
+from linear import convert_pipeline
+from gate import GatedClassifier
+from benchmark_suite import build_pipeline
+
+# define functions
+###################################################################################################################
+def best_time(function, repeat):
+    """
+    Returns the result of the function and the fastest of several runs in seconds.
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds)
+
+
+def score(y_test, y_pred, category_names, gate_index):
+    """
+    Returns the recall and f1 scores of the predictions. The recall of the other labels is reported on its own,
+    since only they lose recall when messages do not pass the gate.
+    """
+    others = [i for i in range(len(category_names)) if i != gate_index]
+    return {
+        "micro_recall": round(recall_score(y_test, y_pred, average='micro', zero_division=1), 4),
+        "other_labels_micro_recall": round(recall_score(y_test[:, others], y_pred[:, others], average='micro', zero_division=1), 4),
+        "weighted_f1": round(f1_score(y_test, y_pred, average='weighted', zero_division=1), 4),
+    }
+
+
+def benchmark_gate(model, X_test, y_test, category_names, gate_label, thresholds, repeat):
+    """
+    Compares the classifier of the model with and without the gate on the held out messages.
+    The features are computed once, they are the same with and without the gate.
+
+    Returns:
+        results (dict): the throughput and the scores without the gate and for every threshold.
+    """
+    gate_index = category_names.index(gate_label)
+    features, feature_seconds = best_time(lambda: model[:-1].transform(X_test), repeat)
+    classifier = model[-1]
+
+    def measure(predictor):
+        y_pred, seconds = best_time(lambda: np.asarray(predictor.predict(features)), repeat)
+        return dict(score(y_test, y_pred, category_names, gate_index),
+                    classifier_messages_per_second=round(len(X_test) / seconds, 1),
+                    end_to_end_messages_per_second=round(len(X_test) / (feature_seconds + seconds), 1))
+
+    baseline = measure(classifier)
+    results = {"messages": len(X_test), "gate": gate_label, "feature_seconds": round(feature_seconds, 4), "no_gate": baseline}
+
+    for threshold in thresholds:
+        gated = GatedClassifier(classifier, gate_index=gate_index, threshold=threshold)
+        result = measure(gated)
+        result["pass_rate"] = round(len(gated.gate(features)[1]) / len(X_test), 4)
+        result["classifier_speedup"] = round(result["classifier_messages_per_second"] / baseline["classifier_messages_per_second"], 2)
+        result["end_to_end_speedup"] = round(result["end_to_end_messages_per_second"] / baseline["end_to_end_messages_per_second"], 2)
+        result["other_labels_recall_loss"] = round(baseline["other_labels_micro_recall"] - result["other_labels_micro_recall"], 4)
+        results["threshold_{}".format(threshold)] = result
+
+    return results
+
+
+def print_report(results, thresholds):
+    baseline = results["no_gate"]
+    print('Gate "{}" on {} held out messages (features {:.2f}s):'.format(results["gate"], results["messages"], results["feature_seconds"]))
+    print('    {:>10} {:>10} {:>16} {:>10} {:>16} {:>10} {:>14} {:>12}'.format(
+        'threshold', 'pass rate', 'classifier msg/s', 'speedup', 'end to end msg/s', 'speedup', 'other recall', 'recall loss'))
+    print('    {:>10} {:>10} {:>16} {:>10} {:>16} {:>10} {:>14} {:>12}'.format(
+        '-', 1.0, baseline["classifier_messages_per_second"], 1.0, baseline["end_to_end_messages_per_second"], 1.0,
+        baseline["other_labels_micro_recall"], 0.0))
+    for threshold in thresholds:
+        result = results["threshold_{}".format(threshold)]
+        print('    {:>10} {:>10} {:>16} {:>10} {:>16} {:>10} {:>14} {:>12}'.format(
+            threshold, result["pass_rate"], result["classifier_messages_per_second"], result["classifier_speedup"],
+            result["end_to_end_messages_per_second"], result["end_to_end_speedup"], result["other_labels_micro_recall"],
+            result["other_labels_recall_loss"]))
+
+
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Reports the throughput gain and the recall loss of the two-stage (gated) prediction on the held out split of train_classifier.py.',
+        epilog='Example: python benchmark_gate.py ../data/DisasterResponse.db --gate related --thresholds 0.2 0.35 0.5')
+    parser.add_argument('database_filepath', help='filepath of the disaster messages database (or parquet file)')
+    parser.add_argument('--gate', choices=['related', 'aid_related'], default='related', help='label of the first stage (default related)')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.2, 0.35, 0.5, 0.65], help='gate thresholds to compare')
+    parser.add_argument('--model-type', choices=['multioutput', 'linear'], default='multioutput', help='type of the classifier (default multioutput)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs, the fastest is reported (default 3)')
+    parser.add_argument('--output', default=None, help='optional filepath of the JSON results')
+    return parser.parse_args()
+
+
+# define main function
+###################################################################################################################
+def main():
+    args = parse_args()
+
+    print('Loading data...\n    DATABASE: {}'.format(args.database_filepath))
+    X, y, category_names = load_data(args.database_filepath)
+    if args.gate not in category_names:
+        sys.exit('The gate label {} has only one category in this database.'.format(args.gate))
+
+    # the same held out split as train_classifier.py
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+
+    print('Fitting model on the training split...')
+    model = build_pipeline().fit(X_train, y_train)
+    if args.model_type == 'linear':
+        model = convert_pipeline(model)
+
+    print('Predicting the held out split...')
+    results = benchmark_gate(model, X_test, np.asarray(y_test), category_names, args.gate, args.thresholds, args.repeat)
+    print_report(results, args.thresholds)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print('Results saved!\n    RESULTS: {}'.format(args.output))
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
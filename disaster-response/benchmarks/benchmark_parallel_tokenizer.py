@@ -0,0 +1,110 @@
+# import libraries
+###################################################################################################################
+import os
+import sys
+import json
+import time
+import argparse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(BENCHMARKS_DIR), "models"))
+
+from features import ParallelTokenizer, get_tokenizer_pool
+from benchmark_tokenizer import load_messages
+from synthetic_data import generate_data
+
+# define functions
+###################################################################################################################
+def benchmark_jobs(messages, n_jobs, repeat, reference=None):
+    """
+    Measures the throughput of the ParallelTokenizer with n_jobs workers. The start of the pool (including loading the NLTK corpora in every worker)
+    is measured on its own, since it is paid once per process and not per fit.
+
+    Returns:
+        result (dict): the timings.
+        tokens (list): the tokens of the messages.
+    """
+    start = time.perf_counter()
+    if n_jobs > 1:
+        # start all workers and wait until every one of them has loaded the tokenizer
+        pool = get_tokenizer_pool(n_jobs)
+        list(pool.map(len, [[]] * n_jobs))
+    startup_seconds = time.perf_counter() - start
+
+    tokenizer = ParallelTokenizer(n_jobs=n_jobs, min_messages=0)
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = tokenizer.transform(messages)
+        seconds.append(time.perf_counter() - start)
+
+    result = {
+        "n_jobs": n_jobs,
+        "startup_seconds": round(startup_seconds, 3),
+        "seconds": round(min(seconds), 4),
+        "messages_per_second": round(len(messages) / min(seconds), 1),
+    }
+    if reference is not None:
+        result["same_tokens"] = tokens == reference
+    return result, tokens
+
+
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Reports how the tokenization of the ParallelTokenizer scales with the number of worker processes and checks that the tokens do not change.',
+        epilog='Example: python benchmark_parallel_tokenizer.py --input ../data/DisasterResponse.db --jobs 1 2 4 8')
+    parser.add_argument('--input', default=None, help='messages csv file or database (default: generated messages)')
+    parser.add_argument('--n-messages', type=int, default=20000, help='number of generated messages, or the maximum number of read ones (default 20000)')
+    parser.add_argument('--jobs', type=int, nargs='+', default=None, help='numbers of workers to compare (default 1, 2, 4, ... up to the number of cores)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs, the fastest is reported (default 3)')
+    parser.add_argument('--output', default=None, help='optional filepath of the JSON results')
+    return parser.parse_args()
+
+
+# define main function
+###################################################################################################################
+def main():
+    args = parse_args()
+    n_cores = os.cpu_count()
+    jobs = args.jobs or sorted({1, n_cores} | {2 ** i for i in range(1, n_cores.bit_length()) if 2 ** i <= n_cores})
+
+    if args.input:
+        messages = load_messages(args.input)[:args.n_messages]
+    else:
+        messages = generate_data(args.n_messages)[0]["message"].tolist()
+    print('Benchmarking the parallel tokenizer on {} messages and {} cores...'.format(len(messages), n_cores))
+
+    results = {"messages": len(messages), "cores": n_cores, "jobs": []}
+    reference, serial_seconds = None, None
+    print('    {:>6} {:>10} {:>10} {:>12} {:>8} {:>11} {:>12}'.format('n_jobs', 'startup', 'seconds', 'messages/s', 'speedup', 'efficiency', 'same tokens'))
+    for n_jobs in jobs:
+        result, tokens = benchmark_jobs(messages, n_jobs, args.repeat, reference)
+        if reference is None:
+            reference, serial_seconds = tokens, result["seconds"]
+            result["same_tokens"] = True
+        result["speedup"] = round(serial_seconds / result["seconds"], 2)
+        result["efficiency"] = round(result["speedup"] / n_jobs, 2)
+        results["jobs"].append(result)
+        print('    {:>6} {:>9.2f}s {:>9.2f}s {:>12.0f} {:>7.2f}x {:>11.2f} {:>12}'.format(
+            n_jobs, result["startup_seconds"], result["seconds"], result["messages_per_second"], result["speedup"], result["efficiency"],
+            str(result["same_tokens"])))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print('Results saved!\n    RESULTS: {}'.format(args.output))
+
+    if not all(result["same_tokens"] for result in results["jobs"]):
+        sys.exit(1)
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# import libraries
+###################################################################################################################
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+# modules that take long to import and should only be imported when they are needed
+HEAVY_MODULES = ["pandas", "sklearn", "scipy", "nltk", "joblib", "sqlalchemy", "plotly"]
+
+# the entry points: a name, the folder they are run from and the python code, e.g. the help of a script or the import of the web app by a worker
+ENTRY_POINTS = [
+    ("python", PROJECT_DIR, "pass"),
+    ("process_data.py -h", os.path.join(PROJECT_DIR, "data"), "process_data.py -h"),
+    ("train_classifier.py -h", os.path.join(PROJECT_DIR, "models"), "train_classifier.py -h"),
+    ("score_messages.py -h", os.path.join(PROJECT_DIR, "models"), "score_messages.py -h"),
+    ("import run (web worker)", os.path.join(PROJECT_DIR, "app"), "import run"),
+]
+
+# runs a script (or a statement) and reports the heavy modules it imported on the last line of stderr
+WRAPPER = """
+import sys, runpy
+command = {command!r}
+if command.split()[0].endswith(".py"):
+    sys.argv = command.split()
+    sys.path.insert(0, "")
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit:
+        pass
+else:
+    exec(command)
+print("HEAVY:" + ",".join(name for name in {heavy!r} if name in sys.modules), file=sys.stderr)
+"""
+
+# define functions
+###################################################################################################################
+def measure(directory, command, repeat):
+    """
+    Starts a new interpreter that runs the command several times and measures the wall time until it exits.
+
+    Returns:
+        seconds (list): the wall time of every run.
+        heavy_modules (list): the heavy modules imported by the command.
+    """
+    seconds, heavy_modules = [], []
+    code = WRAPPER.format(command=command, heavy=HEAVY_MODULES)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-c", code], cwd=directory, capture_output=True, text=True)
+        seconds.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            raise RuntimeError("{} failed:\n{}".format(command, process.stderr))
+        last_line = process.stderr.strip().splitlines()[-1]
+        heavy_modules = [name for name in last_line[len("HEAVY:"):].split(",") if name]
+    return seconds, heavy_modules
+
+
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Measures the start-up time of the command line scripts and of the web app import (a worker boot), '
+                    'lists the heavy modules every entry point imports and fails if one of them exceeds the budget.',
+        epilog='Example: python benchmark_startup.py --budget 1.0 --repeat 5')
+    parser.add_argument('--budget', type=float, default=1.0, help='maximum median start-up time of every entry point in seconds (default 1.0)')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs of every entry point, the median is reported (default 5)')
+    parser.add_argument('--output', default=None, help='optional filepath of the JSON results')
+    return parser.parse_args()
+
+
+# define main function
+###################################################################################################################
+def main():
+    args = parse_args()
+
+    print('Measuring the start-up time of {} entry points ({} runs each, budget {:.2f}s)...'.format(len(ENTRY_POINTS) - 1, args.repeat, args.budget))
+    print('    {:26s} {:>8s} {:>8s}  {:8s} heavy modules'.format('entry point', 'median', 'max', 'budget'))
+    results = {"budget_seconds": args.budget, "entry_points": {}}
+    over_budget = []
+    for name, directory, command in ENTRY_POINTS:
+        seconds, heavy_modules = measure(directory, command, args.repeat)
+        median = statistics.median(seconds)
+        within_budget = median <= args.budget
+        if not within_budget:
+            over_budget.append(name)
+        results["entry_points"][name] = {"median_seconds": round(median, 3), "max_seconds": round(max(seconds), 3),
+                                         "within_budget": within_budget, "heavy_modules": heavy_modules}
+        print('    {:26s} {:7.2f}s {:7.2f}s  {:8s} {}'.format(name, median, max(seconds), 'ok' if within_budget else 'OVER', ", ".join(heavy_modules) or '-'))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print('Results saved!\n    RESULTS: {}'.format(args.output))
+
+    if over_budget:
+        print('Over budget: {}'.format(", ".join(over_budget)))
+        sys.exit(1)
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+# import libraries
+###################################################################################################################
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+import sklearn
+from sklearn.model_selection import KFold, cross_validate
+from sklearn.metrics import make_scorer, f1_score
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is then not reported
+    resource = None
+
+import joblib
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARKS_DIR)
+for folder in ["data", "models", "app"]:
+    sys.path.append(os.path.join(PROJECT_DIR, folder))
+
+from synthetic_data import write_csv
+from process_data import load_data as load_csv_data, clean_data
+from tokenizer import tokenize, lemmatize
+from train_classifier import build_model
+
+STAGES = ["tokenize", "clean_data", "fit", "predict", "app"]
+
+# define functions
+###################################################################################################################
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of the process so far in MB, or None if it cannot be measured on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    """
+    Returns the short hash of the checked out commit, so results of different commits can be told apart.
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_labels(df):
+    """
+    Selects the label columns with more than one category (1/0) like load_data of train_classifier.py.
+
+    Returns:
+        X (series): the messages.
+        y (dataframe): the labels.
+    """
+    category_names = [col for col in df.columns if col not in ["id", "message", "original", "genre"] and df[col].nunique() > 1]
+    return df["message"].reset_index(drop=True), df[category_names].astype(int).reset_index(drop=True)
+
+
+def benchmark_tokenize(messages):
+    """
+    Measures the throughput of the tokenizer. The lemma cache is cleared first, so every run starts cold.
+    """
+    lemmatize.cache_clear()
+    start = time.perf_counter()
+    nr_tokens = sum(len(tokenize(message)) for message in messages)
+    seconds = time.perf_counter() - start
+    return {
+        "messages": len(messages),
+        "tokens": nr_tokens,
+        "seconds": round(seconds, 4),
+        "messages_per_second": round(len(messages) / seconds, 1),
+        "tokens_per_second": round(nr_tokens / seconds, 1),
+    }
+
+
+def benchmark_clean_data(messages_filename, categories_filename, repeat):
+    """
+    Measures loading and cleaning the csv files like process_data.py. The best of several runs is reported.
+
+    Returns:
+        result (dict): the timings.
+        df (dataframe): the cleaned data.
+    """
+    load_seconds, clean_seconds = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = load_csv_data(messages_filename, categories_filename)
+        load_seconds.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        df = clean_data(df)
+        clean_seconds.append(time.perf_counter() - start)
+
+    result = {
+        "rows": len(df),
+        "load_seconds": round(min(load_seconds), 4),
+        "clean_seconds": round(min(clean_seconds), 4),
+        "rows_per_second": round(len(df) / min(clean_seconds), 1),
+    }
+    return result, df
+
+
+def build_pipeline():
+    """
+    Returns the pipeline of build_model with a single parameter combination of its grid, so the benchmark times one fit instead of the whole search.
+    """
+    pipeline = build_model().estimator
+    pipeline.set_params(lr__estimator__estimator__C=1, lr__estimator__estimator__max_iter=5000,
+                        lr__estimator__estimator__solver='lbfgs', lr__estimator__estimator__class_weight='balanced')
+    return pipeline
+
+
+def benchmark_fit(X, y, n_folds):
+    """
+    Measures the fit time of the pipeline (features and classifier) for every fold of a cross-validation.
+    """
+    scores = cross_validate(build_pipeline(), X, y, cv=KFold(n_folds, shuffle=True, random_state=42),
+                            scoring=make_scorer(f1_score, average='weighted', zero_division=1))
+    return {
+        "folds": n_folds,
+        "fit_seconds_per_fold": [round(seconds, 3) for seconds in scores["fit_time"]],
+        "mean_fit_seconds": round(float(np.mean(scores["fit_time"])), 3),
+        "mean_score_seconds": round(float(np.mean(scores["score_time"])), 3),
+        "mean_f1": round(float(np.mean(scores["test_score"])), 4),
+    }
+
+
+def benchmark_predict(model, X, batch_sizes, min_messages):
+    """
+    Measures the prediction throughput of the fitted model for batches of different sizes.
+    Every batch size predicts at least min_messages messages, so small batches are timed over many calls.
+    """
+    results = {}
+    for batch_size in batch_sizes:
+        batch = X.iloc[:batch_size].tolist()
+        nr_calls = max(1, -(-min_messages // len(batch)))
+        start = time.perf_counter()
+        for _ in range(nr_calls):
+            model.predict(batch)
+        seconds = time.perf_counter() - start
+        results[str(batch_size)] = {
+            "calls": nr_calls,
+            "seconds_per_call": round(seconds / nr_calls, 6),
+            "predictions_per_second": round(nr_calls * len(batch) / seconds, 1),
+        }
+    return results
+
+
+def latency_percentiles(seconds):
+    return {
+        "requests": len(seconds),
+        "p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(seconds, 99)) * 1000, 3),
+        "mean_ms": round(float(np.mean(seconds)) * 1000, 3),
+    }
+
+
+def benchmark_app(df, model_filepath, X, nr_requests, tmp_dir):
+    """
+    Measures the request latency of the Flask app with its test client (in process, without a network).
+    The app is configured with environment variables to use the benchmark database and model.
+    """
+    database_filepath = os.path.join(tmp_dir, "DisasterResponse.db")
+    conn = sqlite3.connect(database_filepath)
+    df.to_sql("DisasterResponse", conn, index=False)
+    conn.close()
+
+    os.environ["DR_DATABASE_FILEPATH"] = database_filepath
+    os.environ["DR_TABLE_NAME"] = "DisasterResponse"
+    os.environ["DR_MODEL_FILEPATH"] = model_filepath
+    import run
+
+    client = run.app.test_client()
+    queries = X.iloc[:nr_requests].tolist()
+
+    # the first request loads the model and the dashboard data
+    start = time.perf_counter()
+    client.get('/go', query_string={'query': queries[0]})
+    first_request_seconds = time.perf_counter() - start
+
+    def time_requests(send):
+        seconds = []
+        for query in queries:
+            start = time.perf_counter()
+            response = send(query)
+            seconds.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError('Request failed with status {}'.format(response.status_code))
+        return seconds
+
+    return {
+        "first_request_seconds": round(first_request_seconds, 4),
+        "go": latency_percentiles(time_requests(lambda query: client.get('/go', query_string={'query': query}))),
+        "api_classify": latency_percentiles(time_requests(lambda query: client.post('/api/classify', json={'message': query}))),
+        "index": latency_percentiles(time_requests(lambda query: client.get('/'))),
+    }
+
+
+def flatten(results, prefix=""):
+    """
+    Flattens the nested results into {"stage.metric": value} for the numeric metrics.
+    """
+    flat = {}
+    for key, value in results.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(baseline, current):
+    """
+    Prints the metrics of both runs next to each other with the ratio current / baseline.
+    """
+    baseline_metrics, current_metrics = flatten(baseline["results"]), flatten(current["results"])
+    print('Comparison with {} (commit {}):'.format(baseline.get("timestamp"), baseline.get("commit")))
+    for name, value in current_metrics.items():
+        if name in baseline_metrics:
+            old_value = baseline_metrics[name]
+            ratio = '{:.2f}x'.format(value / old_value) if old_value else '-'
+            print('    {:55s} {:>14} -> {:>14}  {}'.format(name, old_value, value, ratio))
+
+
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the tokenizer, the data cleaning, the training and the prediction of the pipeline and the latency of the web app on generated messages.',
+        epilog='Example: python benchmark_suite.py --n-messages 5000 --output results.json --compare baseline.json')
+    parser.add_argument('--n-messages', type=int, default=5000, help='number of generated messages (default 5000)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the message generator (default 0)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='stages to run (default all)')
+    parser.add_argument('--folds', type=int, default=3, help='number of cross-validation folds of the fit benchmark (default 3)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000], help='batch sizes of the prediction benchmark')
+    parser.add_argument('--requests', type=int, default=200, help='number of requests per endpoint of the app benchmark (default 200)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of the clean_data benchmark (default 3)')
+    parser.add_argument('--output', default='benchmark_results.json', help='filepath of the JSON results (default benchmark_results.json)')
+    parser.add_argument('--compare', default=None, help='filepath of the JSON results of an earlier run to compare with')
+    return parser.parse_args()
+
+
+# define main function
+###################################################################################################################
+def main():
+    args = parse_args()
+    stages = set(args.stages)
+    # predicting and the app need a fitted model
+    if stages & {"predict", "app"}:
+        stages.add("fit")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sklearn": sklearn.__version__,
+        "pandas": pd.__version__,
+        "n_messages": args.n_messages,
+        "seed": args.seed,
+        "results": {},
+    }
+    results = report["results"]
+
+    with tempfile.TemporaryDirectory(prefix="dr_benchmark_") as tmp_dir:
+        print('Generating {} messages...'.format(args.n_messages))
+        messages_filename, categories_filename = write_csv(args.n_messages, tmp_dir, seed=args.seed)
+
+        clean_result, df = benchmark_clean_data(messages_filename, categories_filename, args.repeat)
+        if "clean_data" in stages:
+            print('Benchmarking clean_data...')
+            results["clean_data"] = dict(clean_result, peak_rss_mb=peak_rss_mb())
+        X, y = prepare_labels(df)
+
+        if "tokenize" in stages:
+            print('Benchmarking tokenize...')
+            results["tokenize"] = dict(benchmark_tokenize(X.tolist()), peak_rss_mb=peak_rss_mb())
+
+        if "fit" in stages:
+            print('Benchmarking fit ({} folds)...'.format(args.folds))
+            results["fit"] = dict(benchmark_fit(X, y, args.folds), peak_rss_mb=peak_rss_mb())
+
+            start = time.perf_counter()
+            model = build_pipeline().fit(X, y)
+            results["fit"]["full_fit_seconds"] = round(time.perf_counter() - start, 3)
+            model_filepath = os.path.join(tmp_dir, "dr_classifier.pkl")
+            joblib.dump(model, model_filepath)
+
+        if "predict" in stages:
+            print('Benchmarking predict...')
+            results["predict"] = dict(benchmark_predict(model, X, args.batch_sizes, min_messages=1000), peak_rss_mb=peak_rss_mb())
+
+        if "app" in stages:
+            print('Benchmarking the web app...')
+            results["app"] = dict(benchmark_app(df, model_filepath, X, args.requests, tmp_dir), peak_rss_mb=peak_rss_mb())
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(report, indent=2))
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print('Results saved!\n    RESULTS: {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare_results(json.load(file), report)
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
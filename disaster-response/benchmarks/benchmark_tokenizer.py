@@ -0,0 +1,108 @@
+# import libraries
+###################################################################################################################
+import os
+import re
+import sys
+import time
+import sqlite3
+import pandas as pd
+
+from nltk.tokenize import word_tokenize
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+from tokenizer import tokenize
+
+# define functions
+###################################################################################################################
+def legacy_tokenize(text):
+    """
+    The original implementation of the tokenizer, kept as the reference for the output and the speed of tokenizer.tokenize.
+
+    Parameters:
+        text (str): a single message.
+
+    Return:
+        clean_tokens (list): A list of the resulting tokens for the passed string after the tokenization processing.
+    """
+    tokens = word_tokenize(text)
+    tokens = [tok.lower().strip() for tok in tokens if tok not in stopwords.words("english")]
+    lemmatizer = WordNetLemmatizer()
+    lemmatized_tokens = [lemmatizer.lemmatize(tok, pos='v') for tok in tokens]
+    clean_tokens = [tok for tok in lemmatized_tokens if not re.match(r"^[\W_]+", tok)]
+    clean_tokens = [tok for tok in clean_tokens if not re.search(r"\d", tok)]
+    return clean_tokens
+
+
+def load_messages(filepath):
+    """
+    Loads the message column either from the messages csv file or from the SQL lite database created by process_data.py.
+
+    Parameters:
+        filepath (str): path to a csv file or to a .db file.
+
+    Returns:
+        messages (list): list of message strings.
+    """
+    if filepath.endswith(".db"):
+        conn = sqlite3.connect(filepath)
+        table_name = os.path.basename(filepath).replace(".db", "")
+        messages = pd.read_sql_query("SELECT message FROM '{}'".format(table_name), conn)["message"]
+    else:
+        messages = pd.read_csv(filepath, encoding="utf-8", usecols=["message"])["message"]
+
+    return messages.fillna("").tolist()
+
+
+def time_tokenizer(tokenizer, messages):
+    """
+    Runs the tokenizer over all messages and measures the elapsed time.
+
+    Returns:
+        tokens (list): list with the tokens of every message.
+        seconds (float): elapsed wall time.
+    """
+    start = time.perf_counter()
+    tokens = [tokenizer(message) for message in messages]
+    return tokens, time.perf_counter() - start
+
+
+# define main function
+###################################################################################################################
+def main():
+    if len(sys.argv) in (2, 3):
+        filepath = sys.argv[1]
+        limit = int(sys.argv[2]) if len(sys.argv) == 3 else None
+
+        messages = load_messages(filepath)[:limit]
+        print('Benchmarking tokenizers on {} messages...'.format(len(messages)))
+
+        legacy_tokens, legacy_seconds = time_tokenizer(legacy_tokenize, messages)
+        cached_tokens, cached_seconds = time_tokenizer(tokenize, messages)
+
+        # check that the output did not change
+        mismatches = sum(1 for legacy, cached in zip(legacy_tokens, cached_tokens) if legacy != cached)
+        nr_tokens = sum(len(tokens) for tokens in cached_tokens)
+
+        print('    legacy tokenize: {:8.2f}s  {:10.0f} messages/s  {:10.0f} tokens/s'
+              .format(legacy_seconds, len(messages) / legacy_seconds, nr_tokens / legacy_seconds))
+        print('    cached tokenize: {:8.2f}s  {:10.0f} messages/s  {:10.0f} tokens/s'
+              .format(cached_seconds, len(messages) / cached_seconds, nr_tokens / cached_seconds))
+        print('    speed-up: {:.1f}x'.format(legacy_seconds / cached_seconds))
+        print('    messages with different tokens: {}'.format(mismatches))
+
+        if mismatches:
+            sys.exit(1)
+
+    else:
+        print('Please provide the filepath of the messages csv file or of the '\
+              'disaster messages database as the first argument and optionally '\
+              'the maximum number of messages as the second argument. '\
+              '\n\nExample: python benchmark_tokenizer.py ../data/messages.csv 5000')
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
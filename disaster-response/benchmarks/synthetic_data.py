@@ -0,0 +1,158 @@
+# import libraries
+###################################################################################################################
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# the label categories in the order of the categories.csv file
+CATEGORY_NAMES = ["related", "request", "offer", "aid_related", "medical_help", "medical_products", "search_and_rescue",
+                  "security", "military", "child_alone", "water", "food", "shelter", "clothing", "money", "missing_people",
+                  "refugees", "death", "other_aid", "infrastructure_related", "transport", "buildings", "electricity", "tools",
+                  "hospitals", "shops", "aid_centers", "other_infrastructure", "weather_related", "floods", "storm", "fire",
+                  "earthquake", "cold", "other_weather", "direct_report"]
+
+# words that make a message belong to a label, next to the parts of the label name itself
+LABEL_WORDS = {
+    "request": ["need", "please", "asking"],
+    "medical_help": ["doctor", "injured", "sick", "nurse"],
+    "water": ["drinking", "thirsty", "bottles"],
+    "food": ["hungry", "rice", "meals"],
+    "shelter": ["tent", "homeless", "roof"],
+    "death": ["dead", "killed", "bodies"],
+    "floods": ["flooding", "river", "flooded"],
+    "storm": ["hurricane", "wind", "cyclone"],
+    "earthquake": ["quake", "aftershock", "collapsed"],
+    "fire": ["burning", "smoke", "flames"],
+    "cold": ["freezing", "snow", "blankets"],
+}
+
+# labels that are only set together with "aid_related", "infrastructure_related" or "weather_related"
+PARENT_LABELS = {
+    "aid_related": ["medical_help", "medical_products", "search_and_rescue", "security", "military", "water", "food", "shelter",
+                    "clothing", "money", "missing_people", "refugees", "death", "other_aid"],
+    "infrastructure_related": ["transport", "buildings", "electricity", "tools", "hospitals", "shops", "aid_centers", "other_infrastructure"],
+    "weather_related": ["floods", "storm", "fire", "earthquake", "cold", "other_weather"],
+}
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "si", "de", "pa", "zu", "ho", "be", "gi", "fa", "wen", "tor", "lin"]
+
+# define functions
+###################################################################################################################
+def build_vocabulary(size, random_state):
+    """
+    Builds a vocabulary of made up words, so the generated messages have a realistic number of distinct tokens.
+
+    Parameters:
+        size (int): number of words.
+        random_state (RandomState): the random generator.
+
+    Returns:
+        vocabulary (array): the words, the most frequent first.
+    """
+    words = set()
+    while len(words) < size:
+        words.add("".join(random_state.choice(SYLLABLES, size=random_state.randint(2, 5))))
+    return np.array(sorted(words))
+
+
+def generate_data(n_messages, seed=0, vocabulary_size=5000):
+    """
+    Generates messages and categories in the format of the messages.csv and categories.csv files, without any download.
+    - Every message is built from a few filler words (drawn with a Zipf distribution, like natural language) and the words of its labels,
+      so a classifier can learn the labels from the text.
+    - The label columns follow the structure of the real data: "related" is sometimes 2, "child_alone" is always 0
+      and the detail labels only occur together with their parent label.
+    - The same seed always generates the same data.
+
+    Parameters:
+        n_messages (int): number of messages.
+        seed (int): seed of the random generator.
+        vocabulary_size (int): number of distinct filler words.
+
+    Returns:
+        messages_df (dataframe): the columns id, message, original and genre.
+        categories_df (dataframe): the columns id and categories.
+    """
+    random_state = np.random.RandomState(seed)
+    vocabulary = build_vocabulary(vocabulary_size, random_state)
+    label_words = {label: label.split("_") + LABEL_WORDS.get(label, []) for label in CATEGORY_NAMES}
+    parents = {child: parent for parent, children in PARENT_LABELS.items() for child in children}
+    topics = [label for label in CATEGORY_NAMES if label not in ["related", "request", "offer", "child_alone", "direct_report"] + list(PARENT_LABELS)]
+
+    messages, categories = [], []
+    for _ in range(n_messages):
+        labels = dict.fromkeys(CATEGORY_NAMES, 0)
+
+        # a quarter of the messages is not related to a disaster
+        if random_state.rand() < 0.75:
+            labels["related"] = 2 if random_state.rand() < 0.01 else 1
+            for topic in random_state.choice(topics, size=random_state.randint(0, 4), replace=False):
+                labels[topic] = 1
+                if topic in parents:
+                    labels[parents[topic]] = 1
+            for label in ["request", "offer", "direct_report"]:
+                labels[label] = int(random_state.rand() < 0.2)
+
+        fillers = vocabulary[np.minimum(random_state.zipf(1.3, size=random_state.randint(3, 25)), vocabulary_size) - 1]
+        words = list(fillers)
+        for label, value in labels.items():
+            if value and label != "related":
+                words.append(random_state.choice(label_words[label]))
+        if random_state.rand() < 0.2:
+            words.append(str(random_state.randint(1, 1000)))
+        random_state.shuffle(words)
+
+        messages.append(" ".join(words).capitalize() + random_state.choice([".", "!", " ?", ""]))
+        categories.append(";".join("{}-{}".format(label, value) for label, value in labels.items()))
+
+    ids = np.arange(1, n_messages + 1)
+    messages_df = pd.DataFrame({
+        "id": ids,
+        "message": messages,
+        "original": [message if random_state.rand() < 0.4 else None for message in messages],
+        "genre": random_state.choice(["direct", "news", "social"], size=n_messages, p=[0.4, 0.5, 0.1]),
+    })
+    categories_df = pd.DataFrame({"id": ids, "categories": categories})
+
+    return messages_df, categories_df
+
+
+def write_csv(n_messages, directory, seed=0):
+    """
+    Writes the generated data as messages.csv and categories.csv into a directory, to be used with process_data.py.
+
+    Returns:
+        messages_filename (str): path of the messages csv file.
+        categories_filename (str): path of the categories csv file.
+    """
+    messages_df, categories_df = generate_data(n_messages, seed=seed)
+    messages_filename = os.path.join(directory, "messages.csv")
+    categories_filename = os.path.join(directory, "categories.csv")
+    messages_df.to_csv(messages_filename, index=False, encoding="utf-8")
+    categories_df.to_csv(categories_filename, index=False, encoding="utf-8")
+    return messages_filename, categories_filename
+
+
+# define main function
+###################################################################################################################
+def main():
+    if len(sys.argv) in (3, 4):
+        n_messages, directory = int(sys.argv[1]), sys.argv[2]
+        seed = int(sys.argv[3]) if len(sys.argv) == 4 else 0
+
+        print('Generating {} messages...'.format(n_messages))
+        messages_filename, categories_filename = write_csv(n_messages, directory, seed=seed)
+        print('    MESSAGES: {}\n    CATEGORIES: {}'.format(messages_filename, categories_filename))
+
+    else:
+        print('Please provide the number of messages as the first argument, the '\
+              'directory to write the messages.csv and categories.csv files to as '\
+              'the second argument and optionally the seed of the random generator '\
+              'as the third argument. \n\nExample: python synthetic_data.py 26000 ../data')
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,15 @@
 # import libraries
 ####################################################################################
+import os
 import sys
+import argparse
+import sqlite3
+from datetime import datetime, timezone
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+
+# the tokenizer and the token store are shared with the training script in the models folder, they are imported when the tokens are stored
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
 
 # define functions
 ####################################################################################
@@ -34,11 +41,10 @@ def load_data(messages_filename, categories_filename):
 def clean_data(df):
     """
     This function takes in the merged datasets and returns the cleaned dataframe. It applies the following cleaning steps:
-        1. Transform the "categories" string column into as many columns as label categories available.
-        2. For each label category it extracts the value 0 or 1, depending whether the category was labelled for the current message (row).
+        1. Parses the "categories" strings in one vectorized pass into one uint8 column per label category (see parse_categories).
+        2. Removes rows with Null or incomplete values in the label categories, in the same pass.
         3. Removes duplicate rows.
-        4. Removes rows with Null values in the label categories.
-        5. Replaces all values of 2 with 1 in  the label categories.  
+        4. Replaces all values of 2 with 1 in the label categories. The id and text columns are not touched.
 
     Parameters:
         df (pandas dataframe): merged datasets of messages and categories
@@ -47,41 +53,121 @@ def clean_data(df):
         df (pandas dataframe): cleaned dataset
     """
 
-    # create a dataframe of the 36 individual category columns
-    categories_df = df["categories"].str.split(pat=";", expand=True)
-
-    # select the first row of the categories dataframe to create a list of column names for the label categories
-    row = categories_df.loc[0]
-    category_colnames = row.apply(lambda x: x[:-2]).tolist()
+    # parse the label categories of the valid rows into a uint8 matrix
+    categories_df = parse_categories(df["categories"])
 
-    # rename the columns of the categories_df
-    categories_df.columns = category_colnames
+    # replace the "categories" column in df with the new category columns of the valid rows
+    df = pd.concat([df.drop(columns="categories").loc[categories_df.index], categories_df], axis=1)
 
-    # convert category values to 0 or 1
-    for column in categories_df.columns:
-        # set each value to be the last character of the string
-        categories_df[column] = categories_df[column].str[-1]
-    
-        # convert column from string to numeric
-        categories_df[column] = categories_df[column].astype(int)
-
-    # replace the "categories" column in df with new category columns
-    df = df.drop("categories", axis=1)
-    df = pd.concat([df, categories_df], axis=1)
-    
     # remove any possible duplicates
     df = df.drop_duplicates()
 
-    # remove all rows where the categories include null values
-    for column in categories_df.columns:
-       df = df[df[column].notna()]
-
-    # replace 2s with 1s
-    for col in df.columns:
-        df[col] = df[col].replace(2.,1.)
+    # replace 2s with 1s in the label categories only
+    df[categories_df.columns] = np.minimum(df[categories_df.columns].to_numpy(), 1)
 
     return df
 
+def parse_categories(categories, category_colnames=None):
+    """
+    This function parses the "categories" strings into one compact uint8 column per label category in a single vectorized pass.
+    All strings like "related-1;request-0;..." are joined into one block of bytes, and the value of every "name-value" pair is the byte before its ";".
+    Rows that do not have a single digit value for every label category are dropped, like the rows with null values in clean_data.
+
+    Parameters:
+        categories (pandas series): the "categories" strings.
+        category_colnames (list): the names of the label categories. If not passed, they are taken from the first row.
+
+    Returns:
+        categories_df (pandas dataframe): one uint8 column per label category, with the index of the valid rows.
+    """
+    if category_colnames is None:
+        category_colnames = [item[:-2] for item in categories.iloc[0].split(";")]
+    nr_labels = len(category_colnames)
+
+    # keep the rows with one "name-value" pair per label category
+    values = categories[categories.str.count(";") == nr_labels - 1]
+
+    # the value of every pair is the byte before its ";" and must follow a "-"
+    block = np.frombuffer((";" + ";".join(values) + ";").encode("utf-8"), dtype=np.uint8)
+    ends = np.flatnonzero(block == ord(";"))[1:]
+    matrix = (block[ends - 1] - ord("0")).reshape(-1, nr_labels)
+    valid = ((matrix <= 9) & (block[ends - 2] == ord("-")).reshape(-1, nr_labels)).all(axis=1)
+    values, matrix = values[valid], matrix[valid]
+
+    return pd.DataFrame(matrix, index=values.index, columns=category_colnames)
+
+
+def stream_data(messages_filename, categories_filename, database_filename, chunksize):
+    """
+    This function runs the whole ETL in chunks, so the peak memory depends on the chunk size and not on the size of the csv files.
+        1. The categories csv file is parsed chunk by chunk into uint8 label columns and staged in the database, indexed by id.
+        2. The messages csv file is read chunk by chunk and merged with the staged categories of its ids.
+        3. Duplicate rows are removed by hashing each row and keeping the hashes of the already saved rows in the database.
+        4. The values 2 are replaced with 1 in the label categories and the rows are appended to the final table in batches.
+
+    Parameters:
+        messages_filename (str): file name of the messages csv file. Example: your_file.csv.
+        categories_filename (str): file name of the categories csv file. Example: your_file.csv.
+        database_filename (str): the file name for the SQL lite database. Example: your_db_name.db.
+        chunksize (int): number of csv rows read at a time.
+
+    Returns:
+        nr_rows (int): number of rows saved to the database.
+    """
+    table_name = database_filename.replace(".db","")
+    conn = sqlite3.connect(database_filename)
+
+    try:
+        conn.execute('DROP TABLE IF EXISTS "_categories_staging"')
+        conn.execute('DROP TABLE IF EXISTS "_row_hashes"')
+        conn.execute('CREATE TABLE "_row_hashes" (hash INTEGER PRIMARY KEY)')
+
+        # stage the parsed categories
+        category_colnames = None
+        for chunk in pd.read_csv(categories_filename, encoding="utf-8", chunksize=chunksize):
+            if category_colnames is None:
+                category_colnames = [item[:-2] for item in chunk["categories"].iloc[0].split(";")]
+            categories_df = parse_categories(chunk["categories"], category_colnames)
+            categories_df.insert(0, "id", chunk.loc[categories_df.index, "id"])
+            categories_df.to_sql("_categories_staging", conn, index=False, if_exists="append")
+        conn.execute('CREATE INDEX "_categories_staging_id" ON "_categories_staging" (id)')
+
+        # merge every chunk of messages with the staged categories of its ids
+        nr_rows = 0
+        table_exists = False
+        for chunk in pd.read_csv(messages_filename, encoding="utf-8", chunksize=chunksize):
+            chunk[["message","original","genre"]] = chunk[["message","original","genre"]].astype(object)
+            ids = ",".join(str(int(message_id)) for message_id in chunk["id"].unique())
+            categories_df = pd.read_sql_query(f'SELECT * FROM "_categories_staging" WHERE id IN ({ids})', conn)
+            df = pd.merge(chunk, categories_df.astype({col: np.uint8 for col in category_colnames}), on="id", how="inner")
+
+            # remove duplicates within the chunk and rows that were already saved by an earlier chunk
+            hashes = pd.util.hash_pandas_object(df, index=False).to_numpy().view(np.int64)
+            keep = ~pd.Series(hashes).duplicated().to_numpy()
+            hash_list = ",".join(str(value) for value in hashes[keep])
+            seen = {row[0] for row in conn.execute(f'SELECT hash FROM "_row_hashes" WHERE hash IN ({hash_list})')} if hash_list else set()
+            keep &= ~np.isin(hashes, list(seen))
+            df = df[keep].copy()
+
+            # replace 2s with 1s in the label categories only
+            df[category_colnames] = np.minimum(df[category_colnames].to_numpy(), 1)
+
+            df.to_sql(table_name, conn, index=False, if_exists="append" if table_exists else "fail")
+            conn.executemany('INSERT INTO "_row_hashes" (hash) VALUES (?)', ((int(value),) for value in hashes[keep]))
+            conn.commit()
+            table_exists = True
+            nr_rows += len(df)
+            print('    {} rows saved'.format(nr_rows))
+
+    finally:
+        conn.execute('DROP TABLE IF EXISTS "_categories_staging"')
+        conn.execute('DROP TABLE IF EXISTS "_row_hashes"')
+        conn.commit()
+        conn.close()
+
+    return nr_rows
+
+
 def save_data(df, database_filename):
     """
     The function creates a SQL lite database in the current directory for a passed dataframe.
@@ -90,34 +176,253 @@ def save_data(df, database_filename):
         df (pandas dataframe): final dataset to be saved.
         database_filename (str): the file name for the SQL lite database. Example: your_db_name.
     """
+    from sqlalchemy import create_engine
+
     engine = create_engine(f"sqlite:///{database_filename}")
     df.to_sql(database_filename.replace(".db",""), engine, index=False)
 
 
+def export_parquet(database_filename, parquet_filename, chunksize=100000):
+    """
+    The function exports the table of the SQL lite database to a columnar parquet file with compact types:
+    uint8 label categories and a dictionary encoded (categorical) genre. The table is read and written in chunks.
+
+    Parameters:
+        database_filename (str): the file name of the SQL lite database. Example: your_db_name.db.
+        parquet_filename (str): the file name of the parquet file. Example: your_db_name.parquet.
+        chunksize (int): number of rows read from the database at a time.
+
+    Returns:
+        nr_rows (int): number of rows exported.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table_name = database_filename.replace(".db","")
+    conn = sqlite3.connect(database_filename)
+
+    try:
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+        label_cols = [col for col in columns if col not in ["id","message","original","genre"]]
+        schema = pa.schema(
+            [("id", pa.int64()), ("message", pa.string()), ("original", pa.string()), ("genre", pa.dictionary(pa.int32(), pa.string()))]
+            + [(col, pa.uint8()) for col in label_cols])
+
+        nr_rows = 0
+        with pq.ParquetWriter(parquet_filename, schema) as writer:
+            for chunk in pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn, chunksize=chunksize):
+                chunk["genre"] = chunk["genre"].astype("category")
+                chunk[label_cols] = chunk[label_cols].astype(np.uint8)
+                writer.write_table(pa.Table.from_pandas(chunk[schema.names], schema=schema, preserve_index=False))
+                nr_rows += len(chunk)
+    finally:
+        conn.close()
+
+    return nr_rows
+
+
+def file_fingerprint(filename):
+    """
+    Returns a string that identifies a version of a file by its path, size and modification time.
+
+    Parameters:
+        filename (str): path to the file.
+
+    Returns:
+        fingerprint (str): the fingerprint of the file.
+    """
+    stat = os.stat(filename)
+    return f"{os.path.abspath(filename)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def prepare_incremental_table(conn, table_name, label_cols):
+    """
+    Creates the table for the incremental mode with a primary key on "id" and an index on "genre", as well as the watermark table.
+    A table created by the full ETL (without primary key) is migrated, keeping the first row of every id.
+
+    Parameters:
+        conn (connection): connection to the SQL lite database.
+        table_name (str): name of the messages table.
+        label_cols (list): names of the label category columns.
+    """
+    columns_sql = ", ".join(['"id" INTEGER PRIMARY KEY', '"message" TEXT', '"original" TEXT', '"genre" TEXT'] + [f'"{col}" INTEGER' for col in label_cols])
+    table_info = list(conn.execute(f'PRAGMA table_info("{table_name}")'))
+
+    if table_info and not any(row[1] == "id" and row[5] for row in table_info):
+        # migrate a table without primary key
+        conn.execute(f'ALTER TABLE "{table_name}" RENAME TO "_{table_name}_old"')
+        conn.execute(f'CREATE TABLE "{table_name}" ({columns_sql})')
+        conn.execute(f'INSERT OR IGNORE INTO "{table_name}" SELECT * FROM "_{table_name}_old" ORDER BY rowid')
+        conn.execute(f'DROP TABLE "_{table_name}_old"')
+    else:
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({columns_sql})')
+
+    conn.execute(f'CREATE INDEX IF NOT EXISTS "{table_name}_genre" ON "{table_name}" ("genre")')
+    conn.execute("""CREATE TABLE IF NOT EXISTS "etl_watermark" (
+        "loaded_at" TEXT, "messages_fingerprint" TEXT, "categories_fingerprint" TEXT, "nr_inserted" INTEGER, "max_id" INTEGER)""")
+
+
+def is_loaded(database_filename, messages_filename, categories_filename):
+    """
+    Checks in the watermark table whether the same versions of both csv files were already loaded into the database.
+
+    Returns:
+        loaded (bool): True if the files were already loaded.
+    """
+    if not os.path.exists(database_filename):
+        return False
+
+    conn = sqlite3.connect(database_filename)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'etl_watermark'").fetchone():
+            return False
+        row = conn.execute('SELECT 1 FROM "etl_watermark" WHERE messages_fingerprint = ? AND categories_fingerprint = ?',
+                           (file_fingerprint(messages_filename), file_fingerprint(categories_filename))).fetchone()
+        return row is not None
+    finally:
+        conn.close()
+
+
+def upsert_data(df, database_filename, messages_filename, categories_filename):
+    """
+    The function inserts the rows of a cleaned dataframe whose ids are not in the database yet and records a watermark for the loaded files.
+    All rows are inserted with a single executemany in one transaction, with the database in WAL mode.
+
+    Parameters:
+        df (pandas dataframe): cleaned dataset of a new batch of messages.
+        database_filename (str): the file name for the SQL lite database. Example: your_db_name.db.
+        messages_filename (str): file name of the messages csv file of the batch.
+        categories_filename (str): file name of the categories csv file of the batch.
+
+    Returns:
+        nr_inserted (int): number of new rows inserted.
+    """
+    table_name = database_filename.replace(".db","")
+    label_cols = [col for col in df.columns if col not in ["id","message","original","genre"]]
+    columns = ["id","message","original","genre"] + label_cols
+
+    conn = sqlite3.connect(database_filename)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            prepare_incremental_table(conn, table_name, label_cols)
+
+            rows = df[columns].astype(object).where(df[columns].notna(), None).values.tolist()
+            cursor = conn.executemany(
+                'INSERT OR IGNORE INTO "{}" ({}) VALUES ({})'.format(table_name, ", ".join(f'"{col}"' for col in columns), ", ".join("?" * len(columns))),
+                rows)
+            nr_inserted = cursor.rowcount
+
+            max_id = conn.execute(f'SELECT MAX(id) FROM "{table_name}"').fetchone()[0]
+            conn.execute('INSERT INTO "etl_watermark" VALUES (?, ?, ?, ?, ?)',
+                         (datetime.now(timezone.utc).isoformat(), file_fingerprint(messages_filename), file_fingerprint(categories_filename), nr_inserted, max_id))
+    finally:
+        conn.close()
+
+    return nr_inserted
+
+
+def save_tokens(database_filename):
+    """
+    Stores the tokens of all messages of the database that have no stored tokens yet (see models/token_store.py), so that
+    train_classifier.py --stored-tokens does not tokenize the messages again.
+
+    Parameters:
+        database_filename (str): the file name of the SQL lite database. Example: your_db_name.db.
+    """
+    from token_store import update_token_store
+
+    print('Storing tokens...\n    DATABASE: {}'.format(database_filename))
+    nr_tokenized, stale = update_token_store(database_filename)
+    if stale:
+        print('    the stored tokens were created by another tokenizer version and were rebuilt')
+    print('    {} messages tokenized'.format(nr_tokenized))
+
+
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Loads, cleans and saves the disaster messages and categories to a SQL lite database.',
+        epilog='Example: python process_data.py disaster_messages.csv disaster_categories.csv DisasterResponse.db')
+    parser.add_argument('messages_filename', help='filepath of the messages csv file')
+    parser.add_argument('categories_filename', help='filepath of the categories csv file')
+    parser.add_argument('database_filename', help='filepath of the database to save the cleaned data to')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='stream the csv files in chunks of this many rows, so the memory use does not grow with the size of the files')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only insert messages with ids that are not in the database yet, instead of creating the database from scratch. '
+                             'Files that were already loaded are skipped.')
+    parser.add_argument('--parquet', default=None, metavar='PARQUET_FILENAME',
+                        help='also export the cleaned table to a columnar parquet file with uint8 labels and a categorical genre')
+    parser.add_argument('--tokens', action='store_true',
+                        help='also store the tokens of every message (token ids per message and a vocabulary table) in the database, '
+                             'to be used by train_classifier.py --stored-tokens')
+    args = parser.parse_args()
+    if args.incremental and args.chunksize:
+        parser.error('--incremental and --chunksize cannot be used together')
+    return args
+
+
 def main():
-    if len(sys.argv) == 4:
+    args = parse_args()
+    messages_filename, categories_filename, database_filename = args.messages_filename, args.categories_filename, args.database_filename
+
+    # the tokens need the local NLTK corpora, they are checked before any data is loaded
+    if args.tokens:
+        from tokenizer import check_nltk_data
+        try:
+            check_nltk_data()
+        except LookupError as error:
+            sys.exit(str(error))
 
-        messages_filename, categories_filename, database_filename = sys.argv[1:]
+    if args.chunksize:
+        print('Streaming data in chunks of {} rows...\n    MESSAGES: {}\n    CATEGORIES: {}\n    DATABASE: {}'
+              .format(args.chunksize, messages_filename, categories_filename, database_filename))
+        stream_data(messages_filename, categories_filename, database_filename, args.chunksize)
+
+    elif args.incremental:
+        if is_loaded(database_filename, messages_filename, categories_filename):
+            print('These files were already loaded into {}, nothing to do.'.format(database_filename))
+            if args.tokens:
+                save_tokens(database_filename)
+            return
 
         print('Loading data...\n    MESSAGES: {}\n    CATEGORIES: {}'
               .format(messages_filename, categories_filename))
         df = load_data(messages_filename, categories_filename)
 
+        print('Cleaning data...')
+        df = clean_data(df)
+
+        print('Inserting new messages...\n    DATABASE: {}'.format(database_filename))
+        nr_inserted = upsert_data(df, database_filename, messages_filename, categories_filename)
+        print('    {} new rows inserted, {} rows skipped because their id was already loaded'.format(nr_inserted, len(df) - nr_inserted))
+
+    else:
+        print('Loading data...\n    MESSAGES: {}\n    CATEGORIES: {}'
+              .format(messages_filename, categories_filename))
+        df = load_data(messages_filename, categories_filename)
+
         print('Cleaning data...')
         df = clean_data(df)
         
         print('Saving data...\n    DATABASE: {}'.format(database_filename))
         save_data(df, database_filename)
         
-        print('Cleaned data saved to database!')
-    
-    else:
-        print('Please provide the filepaths of the messages and categories '\
-              'datasets as the first and second argument respectively, as '\
-              'well as the filepath of the database to save the cleaned data '\
-              'to as the third argument. \n\nExample: python process_data.py '\
-              'disaster_messages.csv disaster_categories.csv '\
-              'DisasterResponse.db')
+    print('Cleaned data saved to database!')
+
+    if args.tokens:
+        save_tokens(database_filename)
+
+    if args.parquet:
+        print('Exporting data...\n    PARQUET: {}'.format(args.parquet))
+        nr_rows = export_parquet(database_filename, args.parquet)
+        print('    {} rows exported'.format(nr_rows))
 
 # run the main code
 if __name__ == '__main__':
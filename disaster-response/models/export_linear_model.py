@@ -0,0 +1,83 @@
+# import libraries
+###################################################################################################################
+import sys
+import time
+import numpy as np
+
+import joblib
+
+# the tokenizer and the custom transformers are imported so that models pickled from the training script's __main__ can be loaded
+from tokenizer import tokenize
+from features import WordCounter, CharacterCounter
+from linear import convert_pipeline
+from train_classifier import load_data, save_model
+
+# define functions
+###################################################################################################################
+def compare_models(model, linear_model, X):
+    """
+    Checks that the vectorized model predicts the same labels as the original model and compares their prediction times.
+
+    Parameters:
+        model (class): the original fitted pipeline.
+        linear_model (class): the converted pipeline.
+        X (series): the messages used for the comparison.
+
+    Returns:
+        mismatches (int): number of messages with at least one different label.
+    """
+    start = time.perf_counter()
+    y_pred = np.asarray(model.predict(X))
+    original_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred_linear = linear_model.predict(X)
+    linear_seconds = time.perf_counter() - start
+
+    mismatches = int((y_pred != y_pred_linear).any(axis=1).sum())
+
+    print('    original model: {:8.2f}s for {} messages'.format(original_seconds, len(X)))
+    print('    linear model:   {:8.2f}s for {} messages'.format(linear_seconds, len(X)))
+    print('    messages with different labels: {}'.format(mismatches))
+
+    return mismatches
+
+
+# define main function
+###################################################################################################################
+def main():
+    if len(sys.argv) in (3, 4):
+        model_filepath, linear_model_filepath = sys.argv[1:3]
+
+        print('Loading model...\n    MODEL: {}'.format(model_filepath))
+        model = joblib.load(model_filepath)
+
+        print('Converting model...')
+        linear_model = convert_pipeline(model)
+
+        if len(sys.argv) == 4:
+            database_filepath = sys.argv[3]
+            print('Comparing predictions...\n    DATABASE: {}'.format(database_filepath))
+            X, _, _ = load_data(database_filepath)
+            if compare_models(model, linear_model, X):
+                print('The converted model does not predict the same labels, it was not saved.')
+                sys.exit(1)
+
+        print('Saving model...\n    MODEL: {}'.format(linear_model_filepath))
+        save_model(linear_model, linear_model_filepath)
+
+        print('Converted model saved!')
+
+    else:
+        print('Please provide the filepath of the trained model as the first argument, '\
+              'the filepath of the pickle file to save the converted model to as the '\
+              'second argument and optionally the filepath of the disaster messages '\
+              'database to check that both models predict the same labels as the third '\
+              'argument. \n\nExample: python export_linear_model.py dr_classifier.pkl '\
+              'dr_classifier_linear.pkl DisasterResponse.db')
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
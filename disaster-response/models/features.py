@@ -0,0 +1,257 @@
+import math
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, HashingVectorizer
+from sklearn.preprocessing import StandardScaler, normalize
+
+from tokenizer import tokenize
+
+# worker pools of ParallelTokenizer by number of workers. A pool is started on first use and reused by every later fit and transform of the process.
+_tokenizer_pools = {}
+
+
+# create a class for a custom transformer to count words in a string
+class WordCounter:
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return [[len(text.split())] for text in X]
+
+
+# create a for custom transformer to measure the length of a string
+class CharacterCounter:
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return [[len(text)] for text in X]
+
+
+def warm_up_tokenizer():
+    # loads the NLTK corpora once per worker, instead of with the first shard of every fit
+    tokenize("Warming up the tokenizer")
+
+
+def tokenize_shard(tokenizer, messages):
+    return [tokenizer(message) for message in messages]
+
+
+def get_tokenizer_pool(n_jobs):
+    """
+    Returns the worker pool of ParallelTokenizer with n_jobs workers, started with the spawn method like the inference pool of the web app.
+    """
+    pool = _tokenizer_pools.get(n_jobs)
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn"), initializer=warm_up_tokenizer)
+        _tokenizer_pools[n_jobs] = pool
+    return pool
+
+
+class ParallelTokenizer(BaseEstimator, TransformerMixin):
+    """
+    - This transformer tokenizes the messages on several cores: the messages are split into shards that are tokenized by a pool of worker processes,
+      and the tokens are returned in the order of the messages.
+    - The workers load the NLTK corpora once when they start, and the pool is kept for all later fits and transforms of the process,
+      so a grid search pays the start of the pool only once.
+    - Small batches (fewer than min_messages) are tokenized in the current process, where the pool would cost more than it saves.
+
+    Parameters:
+        tokenizer (function): function that splits a string into a list of tokens. It must be importable by the workers (a module level function).
+        n_jobs (int): number of worker processes. -1 uses all cores, None or 1 tokenizes in the current process.
+        shard_size (int): number of messages per shard. Defaults to about four shards per worker.
+        min_messages (int): minimum number of messages that are tokenized by the pool.
+    """
+
+    def __init__(self, tokenizer=tokenize, n_jobs=None, shard_size=None, min_messages=1000):
+        self.tokenizer = tokenizer
+        self.n_jobs = n_jobs
+        self.shard_size = shard_size
+        self.min_messages = min_messages
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        """
+        Returns one list of tokens per message.
+        """
+        messages = list(X)
+        n_jobs = multiprocessing.cpu_count() if self.n_jobs == -1 else (self.n_jobs or 1)
+        if n_jobs == 1 or len(messages) < self.min_messages:
+            return tokenize_shard(self.tokenizer, messages)
+
+        shard_size = self.shard_size or math.ceil(len(messages) / (4 * n_jobs))
+        shards = [messages[i:i + shard_size] for i in range(0, len(messages), shard_size)]
+
+        # map returns the shards in their original order
+        tokens = []
+        for shard_tokens in get_tokenizer_pool(n_jobs).map(tokenize_shard, repeat(self.tokenizer), shards):
+            tokens.extend(shard_tokens)
+        return tokens
+
+
+class TokenCountTfidf(BaseEstimator, TransformerMixin):
+    """
+    - This transformer replaces a TfidfVectorizer and a CountVectorizer that sit side by side in a FeatureUnion.
+    - Every message is tokenized only once. The TF-IDF values are derived from the same sparse token count matrix.
+    - The output has the same columns as the two vectorizers together: first the TF-IDF values and then the raw token counts.
+    - With n_jobs the messages are tokenized by a ParallelTokenizer on several cores. The features are the same.
+
+    Parameters:
+        tokenizer (function): function that splits a string into a list of tokens.
+        n_jobs (int): number of worker processes of the tokenization. None tokenizes in the current process.
+    """
+
+    def __init__(self, tokenizer=tokenize, n_jobs=None):
+        self.tokenizer = tokenizer
+        self.n_jobs = n_jobs
+
+    def __setstate__(self, state):
+        # models saved before n_jobs existed tokenize in the current process
+        state.setdefault("n_jobs", None)
+        super().__setstate__(state)
+
+    def fit(self, X, y=None):
+        self.fit_transform(X)
+        return self
+
+    def fit_transform(self, X, y=None):
+        if self.n_jobs in (None, 1):
+            self.count_vectorizer_ = CountVectorizer(tokenizer=self.tokenizer)
+            counts = self.count_vectorizer_.fit_transform(X)
+        else:
+            # the vocabulary is built from the tokens of the workers, sorted like the CountVectorizer sorts it
+            tokens = self._parallel_analyze(X)
+            vocabulary = {token: index for index, token in enumerate(sorted({token for message_tokens in tokens for token in message_tokens}))}
+            self.count_vectorizer_ = CountVectorizer(tokenizer=self.tokenizer, vocabulary=vocabulary).fit([])
+            counts = self._count(tokens)
+        self.tfidf_transformer_ = TfidfTransformer().fit(counts)
+        return self._combine(counts)
+
+    def transform(self, X):
+        if self.n_jobs in (None, 1):
+            counts = self.count_vectorizer_.transform(X)
+        else:
+            counts = self._count(self._parallel_analyze(X))
+        return self._combine(counts)
+
+    def _parallel_analyze(self, X):
+        # lower case like the CountVectorizer before the tokenizer
+        return ParallelTokenizer(self.tokenizer, n_jobs=self.n_jobs).transform(text.lower() for text in X)
+
+    def set_tokenizer(self, tokenizer):
+        """
+        Replaces the tokenizer, also in the fitted count vectorizer, e.g. the stored tokens used for the training by tokenize before the model is saved.
+        The new tokenizer must return the same tokens, the vocabulary is not refitted.
+
+        Parameters:
+            tokenizer (function): function that splits a string into a list of tokens.
+
+        Returns:
+            self (class): the transformer with the new tokenizer.
+        """
+        self.tokenizer = tokenizer
+        if hasattr(self, "count_vectorizer_"):
+            self.count_vectorizer_.tokenizer = tokenizer
+        return self
+
+    def analyze(self, X):
+        """
+        Splits the messages into tokens exactly like the fitted count vectorizer does (lower case, then the tokenizer).
+        Together with transform_tokens it splits transform into the tokenization and the counting.
+
+        Parameters:
+            X (list): the messages.
+
+        Returns:
+            tokens (list): one list of tokens per message.
+        """
+        analyzer = self.count_vectorizer_.build_analyzer()
+        return [analyzer(text) for text in X]
+
+    def transform_tokens(self, tokens):
+        """
+        Computes the features from already tokenized messages. transform_tokens(analyze(X)) equals transform(X).
+
+        Parameters:
+            tokens (list): one list of tokens per message, as returned by analyze.
+
+        Returns:
+            features (sparse matrix): the TF-IDF values and the token counts.
+        """
+        return self._combine(self._count(tokens))
+
+    def _count(self, tokens):
+        vocabulary = self.count_vectorizer_.vocabulary_
+        indices, indptr = [], [0]
+        for message_tokens in tokens:
+            indices.extend(vocabulary[token] for token in message_tokens if token in vocabulary)
+            indptr.append(len(indices))
+
+        counts = sparse.csr_matrix((np.ones(len(indices), dtype=np.int64), indices, indptr), shape=(len(tokens), len(vocabulary)))
+        counts.sum_duplicates()
+        return counts
+
+    def _combine(self, counts):
+        tfidf = self.tfidf_transformer_.transform(counts)
+        return sparse.hstack([tfidf, counts], format="csr")
+
+
+class HashingFeatures(BaseEstimator, TransformerMixin):
+    """
+    - This transformer computes the same feature blocks as the FeatureUnion of train_classifier.py (TF-IDF values, token counts, scaled word count and scaled character count) with a fixed amount of memory.
+    - The tokens are hashed into n_features columns instead of being stored in a vocabulary, so the fitted transformer does not grow with the corpus.
+    - The IDF values and the scalers are estimated incrementally with partial_fit, so the corpus can be streamed in chunks.
+
+    Parameters:
+        n_features (int): number of hash buckets of the token columns.
+        tokenizer (function): function that splits a string into a list of tokens.
+    """
+
+    def __init__(self, n_features=2 ** 17, tokenizer=tokenize):
+        self.n_features = n_features
+        self.tokenizer = tokenizer
+
+    def _hash_counts(self, X):
+        vectorizer = HashingVectorizer(tokenizer=self.tokenizer, token_pattern=None, n_features=self.n_features, alternate_sign=False, norm=None)
+        return vectorizer.transform(X)
+
+    def fit(self, X, y=None):
+        for attribute in ["document_counts_", "n_documents_", "idf_", "word_scaler_", "character_scaler_"]:
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+        return self.partial_fit(X)
+
+    def partial_fit(self, X, y=None):
+        if not hasattr(self, "document_counts_"):
+            self.document_counts_ = np.zeros(self.n_features, dtype=np.int64)
+            self.n_documents_ = 0
+            self.word_scaler_ = StandardScaler()
+            self.character_scaler_ = StandardScaler()
+
+        # every document contributes each of its hash buckets once to the document frequency
+        counts = self._hash_counts(X)
+        self.document_counts_ += np.bincount(counts.indices, minlength=self.n_features)
+        self.n_documents_ += counts.shape[0]
+
+        # smoothed idf, like the default TfidfTransformer
+        self.idf_ = np.log((1 + self.n_documents_) / (1 + self.document_counts_)) + 1
+
+        self.word_scaler_.partial_fit(WordCounter().transform(X))
+        self.character_scaler_.partial_fit(CharacterCounter().transform(X))
+
+        return self
+
+    def transform(self, X):
+        counts = self._hash_counts(X)
+        tfidf = normalize(counts.multiply(self.idf_).tocsr())
+        word_count = self.word_scaler_.transform(WordCounter().transform(X))
+        character_count = self.character_scaler_.transform(CharacterCounter().transform(X))
+        return sparse.hstack([tfidf, counts, word_count, character_count], format="csr")
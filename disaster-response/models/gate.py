@@ -0,0 +1,142 @@
+import numpy as np
+from scipy.special import expit
+
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.pipeline import Pipeline
+from sklearn.utils.extmath import safe_sparse_dot
+
+
+def label_probability(classifier, X, index):
+    """
+    Returns the probability of the label 1 of a single label of a fitted multi-label classifier.
+
+    Parameters:
+        classifier (class): a fitted MultiOutputClassifier or MultiLabelLinearClassifier.
+        X (matrix): the transformed features of the messages.
+        index (int): the column of the label.
+
+    Returns:
+        probabilities (array): one probability per message.
+    """
+    # MultiLabelLinearClassifier: only the weights of this label are multiplied
+    if hasattr(classifier, "coef_"):
+        return expit(np.ravel(safe_sparse_dot(X, classifier.coef_[:, [index]], dense_output=True)) + classifier.intercept_[index])
+
+    estimator = classifier.estimators_[index]
+    classes = list(estimator.classes_)
+    if 1 not in classes:
+        return np.zeros(X.shape[0])
+    return estimator.predict_proba(X)[:, classes.index(1)]
+
+
+def positive_probabilities(classifier, X):
+    """
+    Returns the probability of the positive class (1) for every label as a single matrix.
+
+    Parameters:
+        classifier (class): the fitted multi-label classifier (last step of the model pipeline).
+        X (matrix): the already transformed features of the messages.
+
+    Returns:
+        probabilities (array): array of shape (number of messages, number of labels).
+    """
+    probabilities = classifier.predict_proba(X)
+
+    # MultiOutputClassifier returns one (n_messages, n_classes) array per label
+    if isinstance(probabilities, list):
+        columns = []
+        for estimator, label_proba in zip(classifier.estimators_, probabilities):
+            classes = list(estimator.classes_)
+            if 1 in classes:
+                columns.append(label_proba[:, classes.index(1)])
+            else:
+                columns.append(np.zeros(label_proba.shape[0]))
+        probabilities = np.column_stack(columns)
+
+    return probabilities
+
+
+class GatedClassifier(BaseEstimator, ClassifierMixin):
+    """
+    - This classifier predicts the labels in two stages: first only the gate label (e.g. "related" or "aid_related"), then all labels
+      of the wrapped classifier, but only for the messages whose gate probability reaches the threshold.
+    - The other messages get 0 for every label except the gate label itself, which keeps its own prediction.
+      Most of the traffic is unrelated chatter, so most messages only pay for one label model instead of all of them.
+    - A threshold below 0.5 lets messages with a doubtful gate through (less recall loss), a higher one skips more messages (more throughput).
+
+    Parameters:
+        classifier (class): the multi-label classifier, a MultiOutputClassifier or a MultiLabelLinearClassifier.
+        gate_index (int): the column of the gate label.
+        threshold (float): minimum gate probability for the second stage.
+    """
+
+    def __init__(self, classifier, gate_index=0, threshold=0.5):
+        self.classifier = classifier
+        self.gate_index = gate_index
+        self.threshold = threshold
+
+    @property
+    def classes_(self):
+        return self.classifier.classes_
+
+    def fit(self, X, Y):
+        self.classifier.fit(X, Y)
+        return self
+
+    def partial_fit(self, X, Y, **kwargs):
+        self.classifier.partial_fit(X, Y, **kwargs)
+        return self
+
+    def gate(self, X):
+        """
+        Returns the gate probability of every message and the indices of the messages that reach the threshold.
+        """
+        probabilities = label_probability(self.classifier, X, self.gate_index)
+        return probabilities, np.flatnonzero(probabilities >= self.threshold)
+
+    def predict(self, X):
+        gate_probabilities, passed = self.gate(X)
+        labels = np.zeros((X.shape[0], len(self.classes_)), dtype=int)
+        if len(passed):
+            labels[passed] = self.classifier.predict(X[passed])
+        labels[:, self.gate_index] = gate_probabilities > 0.5
+        return labels
+
+    def predict_proba(self, X):
+        """
+        Returns the probability of the label 1 of every label as an array of shape (number of messages, number of labels).
+        The messages that do not pass the gate get the probability 0 for every label except the gate label.
+        """
+        gate_probabilities, passed = self.gate(X)
+        probabilities = np.zeros((X.shape[0], len(self.classes_)))
+        if len(passed):
+            probabilities[passed] = positive_probabilities(self.classifier, X[passed])
+        probabilities[:, self.gate_index] = gate_probabilities
+        return probabilities
+
+
+def gate_pipeline(pipeline, category_names, gate_label, threshold=0.5):
+    """
+    Wraps the classifier at the end of a fitted pipeline in a GatedClassifier. The fitted feature steps are reused as they are.
+
+    Parameters:
+        pipeline (class): the fitted pipeline.
+        category_names (list): the labels in the order the classifier predicts them.
+        gate_label (str): the label of the first stage, e.g. "related" or "aid_related".
+        threshold (float): minimum gate probability for the second stage.
+
+    Returns:
+        gated_pipeline (class): the fitted pipeline with the gated classifier.
+    """
+    if gate_label not in category_names:
+        raise ValueError(f"The gate label {gate_label} is not predicted by the model (labels with only one category are removed).")
+
+    name, classifier = pipeline.steps[-1]
+    gated_pipeline = Pipeline(pipeline.steps[:-1] + [(name, GatedClassifier(classifier, gate_index=category_names.index(gate_label), threshold=threshold))])
+
+    # keep the information saved with the model by train_classifier.py (label order and training watermark)
+    for attribute in ["category_names_", "max_trained_id_"]:
+        if hasattr(pipeline, attribute):
+            setattr(gated_pipeline, attribute, getattr(pipeline, attribute))
+
+    return gated_pipeline
@@ -0,0 +1,23 @@
+import importlib
+
+# the attributes that models pickled from the __main__ of the training script refer to, and the modules that define them
+MAIN_ATTRIBUTES = {"tokenize": "tokenizer", "WordCounter": "features", "CharacterCounter": "features"}
+
+
+def main_attribute(module_name, name):
+    """
+    - Models pickled while the training script ran as __main__ refer to "__main__.tokenize", "__main__.WordCounter" and "__main__.CharacterCounter".
+    - A script that loads models returns this function from its module level __getattr__, so these names resolve when such a model is unpickled
+      while the script is __main__. The tokenizer and the transformers (and with them NLTK and sklearn) are only imported at that moment,
+      so the script starts without them.
+
+    Parameters:
+        module_name (str): the name of the script module, for the error message.
+        name (str): the looked up attribute.
+
+    Returns:
+        attribute (object): the tokenizer or the transformer class.
+    """
+    if name not in MAIN_ATTRIBUTES:
+        raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(MAIN_ATTRIBUTES[name]), name)
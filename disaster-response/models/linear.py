@@ -0,0 +1,189 @@
+import copy
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.pipeline import Pipeline
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.utils.extmath import safe_sparse_dot
+
+from gate import GatedClassifier
+
+
+def binary_weights(estimator):
+    """
+    Extracts the weights of a fitted binary linear classifier, so that "decision > 0" predicts the label 1.
+    It accepts a LogisticRegression (or any linear classifier with coef_ and intercept_) and a OneVsRestClassifier wrapped around one.
+
+    Parameters:
+        estimator (class): the fitted binary classifier of a single label.
+
+    Returns:
+        coef (array): the weights of the features, or None if the label is constant.
+        intercept (float): the intercept. For a constant label it is +inf or -inf.
+    """
+    classes = list(estimator.classes_)
+
+    if isinstance(estimator, OneVsRestClassifier):
+        # a constant label is fitted as a constant predictor without weights
+        if len(classes) == 1:
+            return None, np.inf if classes[0] == 1 else -np.inf
+        estimator = estimator.estimators_[0]
+
+    if classes != [0, 1]:
+        raise ValueError(f"Expected a binary label with the classes [0, 1], got {classes}.")
+
+    coef = estimator.coef_.toarray() if sparse.issparse(estimator.coef_) else estimator.coef_
+    return np.ravel(coef), float(np.ravel(estimator.intercept_)[0])
+
+
+class MultiLabelLinearClassifier(BaseEstimator, ClassifierMixin):
+    """
+    - This classifier keeps the weights of all labels in one dense matrix of shape (number of features, number of labels).
+    - Predicting a batch of messages is a single sparse-dense matrix multiplication plus a threshold, instead of one Python call per label estimator.
+    - It can be fitted directly (one clone of the estimator per label) or built from an already fitted MultiOutputClassifier with from_multioutput.
+
+    Parameters:
+        estimator (class): the binary linear classifier fitted for every label. Defaults to LogisticRegression.
+    """
+
+    def __init__(self, estimator=None):
+        self.estimator = estimator
+
+    def fit(self, X, Y):
+        estimator = self.estimator if self.estimator is not None else LogisticRegression()
+        Y = np.asarray(Y)
+        self._set_weights([clone(estimator).fit(X, Y[:, i]) for i in range(Y.shape[1])])
+        return self
+
+    @classmethod
+    def from_multioutput(cls, classifier):
+        """
+        Builds the classifier from a fitted MultiOutputClassifier of (one-vs-rest) linear classifiers.
+
+        Parameters:
+            classifier (class): the fitted MultiOutputClassifier.
+
+        Returns:
+            model (class): the equivalent MultiLabelLinearClassifier.
+        """
+        return cls.from_estimators(classifier.estimators_, estimator=classifier.estimator)
+
+    @classmethod
+    def from_estimators(cls, estimators, estimator=None):
+        """
+        Builds the classifier from a list of fitted binary linear classifiers, one per label.
+
+        Parameters:
+            estimators (list): the fitted classifiers in the order of the labels.
+            estimator (class): the unfitted estimator stored as parameter of the classifier.
+
+        Returns:
+            model (class): the MultiLabelLinearClassifier with the weights of all classifiers.
+        """
+        model = cls(estimator=estimator)
+        model._set_weights(estimators)
+        return model
+
+    def _set_weights(self, estimators):
+        weights = [binary_weights(estimator) for estimator in estimators]
+        n_features = next(len(coef) for coef, _ in weights if coef is not None)
+
+        self.coef_ = np.zeros((n_features, len(weights)))
+        self.intercept_ = np.zeros(len(weights))
+        for i, (coef, intercept) in enumerate(weights):
+            if coef is not None:
+                self.coef_[:, i] = coef
+            self.intercept_[i] = intercept
+
+        self.classes_ = [np.array([0, 1]) for _ in weights]
+
+    def sparsify(self):
+        """
+        Stores the weight matrix as a sparse matrix. This makes the model much smaller when most weights are zero,
+        e.g. for hashed features where only the buckets of seen tokens get a weight.
+
+        Returns:
+            self (class): the classifier with the sparse weight matrix.
+        """
+        self.coef_ = sparse.csr_matrix(self.coef_)
+        return self
+
+    def partial_fit(self, X, Y, sample_weight=None, learning_rate=0.01, alpha=0.0001):
+        """
+        Updates the weights of all labels at once with one gradient step of the L2 regularized logistic loss,
+        so an already trained model can learn from new labelled messages without a full retraining.
+        The weights of constant labels (infinite intercept) are not changed.
+
+        Parameters:
+            X (matrix): the transformed features of the messages.
+            Y (array): the labels (0/1), one column per label.
+            sample_weight (array): optional weights of shape (number of messages, number of labels), e.g. to balance the classes of every label.
+            learning_rate (float): size of the gradient step.
+            alpha (float): strength of the L2 regularization.
+
+        Returns:
+            self (class): the updated classifier.
+        """
+        was_sparse = sparse.issparse(self.coef_)
+        coef = self.coef_.toarray() if was_sparse else np.array(self.coef_)
+        trainable = np.isfinite(self.intercept_)
+
+        errors = expit(safe_sparse_dot(X, coef, dense_output=True) + self.intercept_) - np.asarray(Y, dtype=float)
+        if sample_weight is not None:
+            errors *= sample_weight
+        errors[:, ~trainable] = 0
+
+        coef -= learning_rate * (safe_sparse_dot(X.T, errors, dense_output=True) / X.shape[0] + alpha * coef * trainable)
+        self.intercept_ = self.intercept_ - learning_rate * errors.mean(axis=0)
+        self.coef_ = sparse.csr_matrix(coef) if was_sparse else coef
+
+        return self
+
+    def decision_function(self, X):
+        return safe_sparse_dot(X, self.coef_, dense_output=True) + self.intercept_
+
+    def predict(self, X):
+        return (self.decision_function(X) > 0).astype(int)
+
+    def predict_proba(self, X):
+        """
+        Returns the probability of the label 1 for every label as an array of shape (number of messages, number of labels).
+        """
+        return expit(self.decision_function(X))
+
+
+def convert_classifier(classifier):
+    """
+    Returns the MultiLabelLinearClassifier equivalent to a fitted classifier. A classifier that already is one is copied,
+    a GatedClassifier keeps its gate around the converted classifier.
+    """
+    if isinstance(classifier, GatedClassifier):
+        return GatedClassifier(convert_classifier(classifier.classifier), gate_index=classifier.gate_index, threshold=classifier.threshold)
+    if isinstance(classifier, MultiLabelLinearClassifier):
+        return copy.deepcopy(classifier)
+    return MultiLabelLinearClassifier.from_multioutput(classifier)
+
+
+def convert_pipeline(pipeline):
+    """
+    Replaces the MultiOutputClassifier at the end of a fitted pipeline with the equivalent MultiLabelLinearClassifier.
+    The fitted feature steps are reused as they are.
+
+    Parameters:
+        pipeline (class): the fitted pipeline.
+
+    Returns:
+        linear_pipeline (class): the fitted pipeline with the vectorized classifier.
+    """
+    name, classifier = pipeline.steps[-1]
+    linear_pipeline = Pipeline(pipeline.steps[:-1] + [(name, convert_classifier(classifier))])
+
+    # keep the information saved with the model by train_classifier.py (label order and training watermark)
+    for attribute in ["category_names_", "max_trained_id_"]:
+        if hasattr(pipeline, attribute):
+            setattr(linear_pipeline, attribute, getattr(pipeline, attribute))
+
+    return linear_pipeline
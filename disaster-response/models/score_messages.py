@@ -0,0 +1,353 @@
+# import libraries
+###################################################################################################################
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# joblib, sklearn and NLTK are imported when a model is loaded, so the script starts quickly (e.g. for -h)
+from legacy_pickles import main_attribute
+
+# the model of the current (worker) process, loaded once by load_worker_model
+_model = None
+
+# define functions
+###################################################################################################################
+def __getattr__(name):
+    """
+    Resolves the tokenizer and the custom transformers of models pickled from the training script's __main__ (see legacy_pickles.py).
+    """
+    return main_attribute(__name__, name)
+
+
+def load_worker_model(model_filepath, tokenize_jobs=None):
+    """
+    Loads the model once per worker process. The arrays are memory mapped, so the workers share the pages of the model file.
+    With tokenize_jobs the messages of every chunk are tokenized by that many worker processes (see set_tokenize_jobs).
+    """
+    import joblib
+
+    global _model
+    _model = joblib.load(model_filepath, mmap_mode="r")
+    if tokenize_jobs:
+        set_tokenize_jobs(_model, tokenize_jobs)
+
+
+def set_tokenize_jobs(model, n_jobs):
+    """
+    Lets the TokenCountTfidf features of the model tokenize the messages with a pool of n_jobs worker processes.
+    The features do not change, only the tokenization runs on several cores.
+
+    Parameters:
+        model (class): the trained pipeline.
+        n_jobs (int): number of tokenizer processes, -1 uses all cores.
+    """
+    from features import TokenCountTfidf
+
+    features = model.named_steps["features"]
+    for _, transformer in getattr(features, "transformer_list", [("features", features)]):
+        if isinstance(transformer, TokenCountTfidf):
+            transformer.set_params(n_jobs=n_jobs)
+            return
+    raise ValueError("The model has no TokenCountTfidf features (e.g. a model trained with --out-of-core), its tokenization cannot be parallelized.")
+
+
+def score_chunk(ids, messages):
+    """
+    Classifies one chunk of messages with the model of the current process.
+
+    Returns:
+        ids (array): the ids of the messages.
+        labels (array): uint8 array of shape (number of messages, number of labels).
+    """
+    return ids, np.asarray(_model.predict(messages), dtype=np.uint8)
+
+
+def iterate_messages(input_filepath, chunksize, table_name=None, since_id=None):
+    """
+    Reads the id and message columns of a csv file, a SQL lite table or a parquet file in chunks, so the input never has to fit into memory.
+    With since_id only the messages with a higher id are returned. A SQL lite table is read in id order and filtered by the query,
+    a csv or parquet file must be ordered by id to be filtered like this.
+
+    Parameters:
+        input_filepath (str): a .csv, .db or .parquet file.
+        chunksize (int): number of messages per chunk.
+        table_name (str): the table of the SQL lite database. Defaults to the file name without ".db".
+        since_id (int): the highest id that is skipped, None reads all messages.
+
+    Returns:
+        chunks (generator): dataframes with the columns id and message.
+
+    Raises:
+        ValueError: if since_id is given and a csv or parquet file is not ordered by id.
+    """
+    if input_filepath.endswith(".db"):
+        table_name = table_name or os.path.basename(input_filepath).replace(".db", "")
+        query = "SELECT id, message FROM '{}'{} ORDER BY id".format(table_name, "" if since_id is None else " WHERE id > ?")
+        conn = sqlite3.connect(input_filepath)
+        try:
+            yield from pd.read_sql_query(query, conn, params=None if since_id is None else (int(since_id),), chunksize=chunksize)
+        finally:
+            conn.close()
+        return
+
+    if input_filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(input_filepath).iter_batches(batch_size=chunksize, columns=["id", "message"]))
+    else:
+        chunks = pd.read_csv(input_filepath, usecols=["id", "message"], chunksize=chunksize, encoding="utf-8")
+
+    if since_id is None:
+        yield from chunks
+        return
+
+    # the messages up to since_id can only be skipped by their id if the file is ordered by id
+    last_id = None
+    for chunk in chunks:
+        ids = chunk["id"].to_numpy()
+        if len(ids) and ((last_id is not None and ids[0] < last_id) or (np.diff(ids) < 0).any()):
+            raise ValueError("{} is not ordered by id, an interrupted run can not be resumed (use --restart).".format(input_filepath))
+        if len(ids):
+            last_id = ids[-1]
+        yield chunk[chunk["id"] > since_id]
+
+
+def count_messages(input_filepath, table_name=None):
+    """
+    Returns the number of input messages for the progress, or None if it is not known without reading the whole file (csv).
+    """
+    if input_filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(input_filepath).metadata.num_rows
+    if input_filepath.endswith(".db"):
+        table_name = table_name or os.path.basename(input_filepath).replace(".db", "")
+        conn = sqlite3.connect(input_filepath)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM '{}'".format(table_name)).fetchone()[0]
+        finally:
+            conn.close()
+    return None
+
+
+class SQLiteOutput:
+    """
+    Writes the labels into a SQL lite table with one row per message (id and one column per label).
+    Every chunk is committed on its own, so an interrupted run keeps the scored chunks and can be resumed.
+    """
+
+    def __init__(self, output_filepath, category_names, table_name="classifications"):
+        self.table_name = table_name
+        self.category_names = category_names
+        self.conn = sqlite3.connect(output_filepath)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join('"{}" INTEGER'.format(col) for col in category_names)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS '{}' (id INTEGER PRIMARY KEY, {})".format(table_name, columns))
+        self.conn.commit()
+
+    def progress(self):
+        return self.conn.execute("SELECT COUNT(*), MAX(id) FROM '{}'".format(self.table_name)).fetchone()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM '{}'".format(self.table_name))
+        self.conn.commit()
+
+    def write(self, ids, labels):
+        placeholders = ", ".join("?" * (len(self.category_names) + 1))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO '{}' VALUES ({})".format(self.table_name, placeholders),
+                                  [(int(message_id), *map(int, message_labels)) for message_id, message_labels in zip(ids, labels)])
+
+    def close(self):
+        self.conn.close()
+
+
+class ParquetOutput:
+    """
+    Writes the labels as a directory of parquet files, one file per chunk (id and one uint8 column per label).
+    A file only appears once it is completely written, so an interrupted run keeps the scored chunks and can be resumed.
+    The directory can be read as one table, e.g. with pd.read_parquet.
+    """
+
+    def __init__(self, output_filepath, category_names):
+        self.directory = output_filepath
+        self.category_names = category_names
+        os.makedirs(output_filepath, exist_ok=True)
+        self.nr_parts = len(self._parts())
+
+    def _parts(self):
+        return sorted(name for name in os.listdir(self.directory) if name.startswith("part-") and name.endswith(".parquet"))
+
+    def progress(self):
+        import pyarrow.parquet as pq
+
+        parts = self._parts()
+        if not parts:
+            return 0, None
+        nr_scored = sum(pq.ParquetFile(os.path.join(self.directory, name)).metadata.num_rows for name in parts)
+        # the chunks are written in input order, so the last part holds the highest scored id
+        return nr_scored, int(pd.read_parquet(os.path.join(self.directory, parts[-1]), columns=["id"])["id"].max())
+
+    def clear(self):
+        for name in self._parts():
+            os.remove(os.path.join(self.directory, name))
+        self.nr_parts = 0
+
+    def write(self, ids, labels):
+        df = pd.DataFrame(labels, columns=self.category_names)
+        df.insert(0, "id", np.asarray(ids, dtype=np.int64))
+        filename = os.path.join(self.directory, "part-{:06d}.parquet".format(self.nr_parts))
+        df.to_parquet(filename + ".tmp", index=False)
+        os.replace(filename + ".tmp", filename)
+        self.nr_parts += 1
+
+    def close(self):
+        pass
+
+
+def score_messages(input_filepath, model_filepath, output, chunksize=10000, n_jobs=1, max_pending=None, table_name=None, tokenize_jobs=None):
+    """
+    Streams the messages through the model in chunks and writes the labels of every chunk to the output.
+    - With n_jobs > 1 the chunks are classified by a pool of worker processes that load the model once each.
+    - With tokenize_jobs (and n_jobs = 1) a single model classifies the chunks and only the tokenization of every chunk is spread over a pool,
+      which keeps one copy of the model in memory.
+    - At most max_pending chunks are read ahead of the writer, which bounds the memory to about (max_pending + n_jobs) chunks.
+    - The chunks are written in input order, so the output always holds the messages up to its highest id (the high-water mark).
+      An interrupted run continues after that id, without loading the scored ids (the input must be ordered by id, see iterate_messages).
+
+    Parameters:
+        input_filepath (str): a .csv, .db or .parquet file with the columns id and message.
+        model_filepath (str): the trained model.
+        output (class): the SQLiteOutput or ParquetOutput.
+        chunksize (int): number of messages per chunk.
+        n_jobs (int): number of worker processes, 1 scores in the main process.
+        max_pending (int): maximum number of chunks being scored at the same time. Defaults to 2 * n_jobs.
+        table_name (str): the table of a SQL lite input.
+        tokenize_jobs (int): number of tokenizer processes when n_jobs is 1.
+
+    Returns:
+        nr_scored (int): number of scored messages.
+    """
+    nr_done, since_id = output.progress()
+    total = count_messages(input_filepath, table_name)
+    if since_id is not None:
+        print('    resuming after id {}, {} messages are already scored'.format(since_id, nr_done))
+
+    start = time.perf_counter()
+    nr_scored = 0
+
+    def write(ids, labels):
+        nonlocal nr_scored
+        output.write(ids, labels)
+        nr_scored += len(ids)
+        done = nr_scored + nr_done
+        rate = nr_scored / (time.perf_counter() - start)
+        print('    {} / {} messages scored ({:.0f} messages/s)'.format(done, total if total is not None else '?', rate), flush=True)
+
+    def new_messages():
+        for chunk in iterate_messages(input_filepath, chunksize, table_name, since_id):
+            if len(chunk):
+                yield chunk["id"].to_numpy(), chunk["message"].fillna("").tolist()
+
+    if n_jobs == 1:
+        load_worker_model(model_filepath, tokenize_jobs)
+        for ids, messages in new_messages():
+            write(*score_chunk(ids, messages))
+        return nr_scored
+
+    max_pending = max_pending or 2 * n_jobs
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=load_worker_model, initargs=(model_filepath,)) as executor:
+        pending = deque()
+        for ids, messages in new_messages():
+            pending.append(executor.submit(score_chunk, ids, messages))
+            # wait for the oldest chunk before reading further ahead, the chunks are written in input order
+            while len(pending) >= max_pending:
+                write(*pending.popleft().result())
+        while pending:
+            write(*pending.popleft().result())
+
+    return nr_scored
+
+
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Classifies a file of messages with a trained model in chunks and writes the labels to a SQL lite database or a parquet directory.',
+        epilog='Example: python score_messages.py archive.csv dr_classifier.pkl archive_labels.db --n-jobs 4')
+    parser.add_argument('input_filepath', help='messages to classify: a .csv file, a SQL lite .db file or a .parquet file with the columns id and message')
+    parser.add_argument('model_filepath', help='filepath of the trained model')
+    parser.add_argument('output_filepath', help='a .db file (table "classifications") or a .parquet directory for the labels')
+    parser.add_argument('--table', default=None, help='table of a SQL lite input (default: the file name without .db)')
+    parser.add_argument('--chunksize', type=int, default=10000, help='number of messages per chunk (default 10000)')
+    parser.add_argument('--n-jobs', type=int, default=1, help='number of worker processes (default 1, -1 uses all cores)')
+    parser.add_argument('--tokenize-jobs', type=int, default=None,
+                        help='with --n-jobs 1, tokenize the messages of every chunk with this many worker processes (-1 uses all cores) '
+                             'instead of loading the model in several workers')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='maximum number of chunks in flight, bounds the memory to about (max pending + n jobs) chunks (default 2 * n jobs)')
+    parser.add_argument('--restart', action='store_true', help='discard the labels of an earlier run instead of resuming it')
+    args = parser.parse_args()
+    if args.n_jobs == 0 or args.n_jobs < -1:
+        parser.error('--n-jobs must be a positive number or -1')
+    if args.max_pending is not None and args.max_pending < 1:
+        parser.error('--max-pending must be a positive number')
+    if args.tokenize_jobs is not None and args.n_jobs != 1:
+        parser.error('--tokenize-jobs can only be used with --n-jobs 1')
+    if args.tokenize_jobs is not None and (args.tokenize_jobs == 0 or args.tokenize_jobs < -1):
+        parser.error('--tokenize-jobs must be a positive number or -1')
+    return args
+
+
+# define main function
+###################################################################################################################
+def main():
+    args = parse_args()
+    n_jobs = os.cpu_count() if args.n_jobs == -1 else args.n_jobs
+
+    import joblib
+
+    print('Loading model...\n    MODEL: {}'.format(args.model_filepath))
+    model = joblib.load(args.model_filepath, mmap_mode="r")
+    category_names = getattr(model, 'category_names_', None)
+    if category_names is None:
+        n_labels = np.asarray(model.predict([""])).shape[1]
+        category_names = ['label_{}'.format(i) for i in range(n_labels)]
+        print('    the model was saved without its label names, the columns are named label_0 to label_{}'.format(n_labels - 1))
+    del model
+
+    if args.output_filepath.endswith(".parquet"):
+        output = ParquetOutput(args.output_filepath, category_names)
+    else:
+        output = SQLiteOutput(args.output_filepath, category_names)
+    if args.restart:
+        output.clear()
+
+    print('Scoring messages...\n    INPUT: {}\n    OUTPUT: {}\n    WORKERS: {}'.format(args.input_filepath, args.output_filepath, n_jobs))
+    if args.tokenize_jobs:
+        print('    TOKENIZER WORKERS: {}'.format(args.tokenize_jobs))
+    start = time.perf_counter()
+    try:
+        nr_scored = score_messages(args.input_filepath, args.model_filepath, output, chunksize=args.chunksize, n_jobs=n_jobs,
+                                   max_pending=args.max_pending, table_name=args.table, tokenize_jobs=args.tokenize_jobs)
+    except ValueError as error:
+        sys.exit(str(error))
+    finally:
+        output.close()
+
+    print('Scored {} messages in {:.1f}s!'.format(nr_scored, time.perf_counter() - start))
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()
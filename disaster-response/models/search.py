@@ -0,0 +1,158 @@
+import math
+import time
+import numpy as np
+
+from sklearn.base import BaseEstimator, clone
+from sklearn.model_selection import ParameterGrid, ParameterSampler, check_cv, cross_validate
+
+
+def new_results():
+    return {"params": [], "mean_test_score": [], "std_test_score": [], "mean_fit_time": [], "mean_score_time": []}
+
+
+class ParameterSearch(BaseEstimator):
+    """
+    Base class of the parameter searches. It scores parameter combinations with a cross-validation, keeps the results like GridSearchCV
+    (best_params_, best_score_, best_estimator_ and cv_results_, which is what the training script uses) and fits the best combination on all messages.
+    """
+
+    def _score(self, params, X, y, splits):
+        scores = cross_validate(clone(self.estimator).set_params(**params), X, y, cv=splits, scoring=self.scoring, n_jobs=self.n_jobs)
+        return scores["test_score"], scores["fit_time"], scores["score_time"]
+
+    def _record(self, results, params, test_scores, fit_times, score_times, **extra):
+        results["params"].append(params)
+        results["mean_test_score"].append(test_scores.mean())
+        results["std_test_score"].append(test_scores.std())
+        results["mean_fit_time"].append(fit_times.mean())
+        results["mean_score_time"].append(score_times.mean())
+        for key, value in extra.items():
+            results.setdefault(key, []).append(value)
+        if self.verbose:
+            print("    candidate {}: score {:.4f} {}".format(len(results["params"]), test_scores.mean(), extra))
+
+    def _refit(self, results, candidates, X, y):
+        # the best combination among the candidates, e.g. the ones of the last round or the ones scored on every fold
+        self.best_index_ = max(candidates, key=lambda i: results["mean_test_score"][i])
+        self.best_params_ = results["params"][self.best_index_]
+        self.best_score_ = results["mean_test_score"][self.best_index_]
+        self.cv_results_ = {key: np.array(values) if key != "params" else values for key, values in results.items()}
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+
+class SuccessiveHalvingSearchCV(ParameterSearch):
+    """
+    - This search scores all combinations of the grid on a small random sample of the messages and keeps only the best 1 / factor of them
+      for the next round, which uses factor times more messages. The last round uses all messages.
+    - Most of the compute is spent on the few promising combinations, while the poor ones are dropped after fits on small samples.
+    - Unlike HalvingGridSearchCV of sklearn it supports multi-label targets.
+
+    Parameters:
+        estimator (class): the pipeline to tune.
+        param_grid (dict): lists of values per parameter.
+        factor (int): the share of combinations kept after every round is 1 / factor.
+        min_resources (int): number of messages of the first round. Defaults to the number that ends with all messages in the last round.
+        cv (int): number of cross-validation folds.
+        scoring (function): the scorer that is maximized.
+        n_jobs (int): number of folds fitted in parallel.
+        random_state (int): seed of the samples.
+        verbose (int): prints every evaluated combination if > 0.
+    """
+
+    def __init__(self, estimator, param_grid, factor=3, min_resources=None, cv=5, scoring=None, n_jobs=None, random_state=None, verbose=1):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.factor = factor
+        self.min_resources = min_resources
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.verbose = verbose
+
+    def fit(self, X, y):
+        candidates = list(ParameterGrid(self.param_grid))
+        n_rounds = max(1, math.ceil(math.log(len(candidates), self.factor)))
+        n_messages = len(X)
+        min_resources = self.min_resources or max(n_messages // self.factor ** (n_rounds - 1), 2 * self.cv)
+        order = np.random.RandomState(self.random_state).permutation(n_messages)
+        results = new_results()
+
+        for round_nr in range(n_rounds):
+            n_resources = n_messages if round_nr == n_rounds - 1 else min(n_messages, min_resources * self.factor ** round_nr)
+            sample = np.sort(order[:n_resources])
+            X_sample, y_sample = X.iloc[sample], y.iloc[sample]
+            splits = list(check_cv(self.cv, y_sample, classifier=True).split(X_sample, y_sample))
+
+            round_indices = []
+            for params in candidates:
+                round_indices.append(len(results["params"]))
+                self._record(results, params, *self._score(params, X_sample, y_sample, splits), iter=round_nr, n_resources=n_resources)
+
+            # keep the best 1 / factor of the combinations for the next round
+            ranked = sorted(round_indices, key=lambda i: results["mean_test_score"][i], reverse=True)
+            candidates = [results["params"][i] for i in ranked[:max(1, math.ceil(len(ranked) / self.factor))]]
+
+        return self._refit(results, round_indices, X, y)
+
+
+class TimeBudgetSearchCV(ParameterSearch):
+    """
+    - This search evaluates randomly sampled parameter combinations with a cross-validation until the time budget is spent,
+      so the training time no longer grows with the size of the grid.
+    - Every combination is first scored on one fold only. It is only scored on the other folds if it beats the best combination so far on that fold,
+      so most of the time is spent on promising combinations.
+
+    Parameters:
+        estimator (class): the pipeline to tune.
+        param_distributions (dict): lists of values or scipy distributions per parameter.
+        time_budget (float): number of seconds after which no new combination is started. The first combination is always evaluated.
+        n_iter (int): maximum number of sampled combinations.
+        cv (int): number of cross-validation folds.
+        scoring (function): the scorer that is maximized.
+        n_jobs (int): number of folds fitted in parallel.
+        random_state (int): seed of the parameter sampling.
+        verbose (int): prints every evaluated combination if > 0.
+    """
+
+    def __init__(self, estimator, param_distributions, time_budget=3600, n_iter=100, cv=5, scoring=None, n_jobs=None, random_state=None, verbose=1):
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.time_budget = time_budget
+        self.n_iter = n_iter
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.verbose = verbose
+
+    def fit(self, X, y):
+        start = time.perf_counter()
+        splits = list(check_cv(self.cv, y, classifier=True).split(X, y))
+        results = new_results()
+        best_fold_scores = None
+
+        for params in ParameterSampler(self.param_distributions, self.n_iter, random_state=self.random_state):
+            if results["params"] and time.perf_counter() - start >= self.time_budget:
+                break
+            params = {key: value.item() if isinstance(value, np.generic) else value for key, value in params.items()}
+
+            test_scores, fit_times, score_times = self._score(params, X, y, splits[:1])
+            if best_fold_scores is None or test_scores[0] >= best_fold_scores[0]:
+                more_scores, more_fit_times, more_score_times = self._score(params, X, y, splits[1:])
+                test_scores = np.concatenate([test_scores, more_scores])
+                fit_times = np.concatenate([fit_times, more_fit_times])
+                score_times = np.concatenate([score_times, more_score_times])
+                if best_fold_scores is None or test_scores.mean() > best_fold_scores.mean():
+                    best_fold_scores = test_scores
+
+            self._record(results, params, test_scores, fit_times, score_times, n_folds=len(test_scores),
+                         seconds=round(time.perf_counter() - start, 1))
+
+        # only combinations that were scored on every fold can be the best one
+        complete = [i for i, n_folds in enumerate(results["n_folds"]) if n_folds == len(splits)]
+        return self._refit(results, complete, X, y)
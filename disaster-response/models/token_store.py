@@ -0,0 +1,131 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from tokenizer import tokenize, TOKENIZER_VERSION
+
+# tables of the token store in the SQL lite database
+VOCABULARY_TABLE = "token_vocabulary"
+TOKENS_TABLE = "message_tokens"
+META_TABLE = "token_store_meta"
+
+
+def analyze(message):
+    """
+    Tokenizes a message like the CountVectorizer of the pipeline does: the text is lower cased first, then passed to the tokenizer.
+
+    Parameters:
+        message (str): a single message.
+
+    Returns:
+        tokens (list): the tokens of the message.
+    """
+    return tokenize(message.lower())
+
+
+def prepare_token_store(conn):
+    """
+    Creates the tables of the token store and empties them if their tokens were created by another version of the tokenizer.
+
+    Parameters:
+        conn (connection): connection to the SQL lite database.
+
+    Returns:
+        stale (bool): True if stale tokens were removed.
+    """
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{VOCABULARY_TABLE}" ("token_id" INTEGER PRIMARY KEY, "token" TEXT UNIQUE)')
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{TOKENS_TABLE}" ("id" INTEGER PRIMARY KEY, "token_ids" BLOB)')
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{META_TABLE}" ("key" TEXT PRIMARY KEY, "value" TEXT)')
+
+    row = conn.execute(f'SELECT value FROM "{META_TABLE}" WHERE key = ?', ("tokenizer_version",)).fetchone()
+    stale = row is not None and row[0] != str(TOKENIZER_VERSION)
+    if stale:
+        conn.execute(f'DELETE FROM "{TOKENS_TABLE}"')
+        conn.execute(f'DELETE FROM "{VOCABULARY_TABLE}"')
+    conn.execute(f'INSERT OR REPLACE INTO "{META_TABLE}" VALUES (?, ?)', ("tokenizer_version", str(TOKENIZER_VERSION)))
+    return stale
+
+
+def update_token_store(database_filepath, chunksize=10000):
+    """
+    - This function stores the tokens of every message of the database that has no stored tokens yet, so the messages are tokenized only once
+      and not by every training run, fold and parameter combination.
+    - The tokens are kept as a vocabulary table (token id and token) and one array of token ids per message id.
+    - The store is keyed by TOKENIZER_VERSION: tokens of another version of the tokenizer are removed and rebuilt.
+    - Messages added later (e.g. by the incremental ETL) are tokenized on the next call, so the call is cheap when the store is up to date.
+
+    Parameters:
+        database_filepath (str): the file name of the SQL lite database. Example: your_db_name.db.
+        chunksize (int): number of messages tokenized and inserted at a time.
+
+    Returns:
+        nr_tokenized (int): number of messages tokenized by this call.
+        stale (bool): True if the stored tokens were rebuilt because the tokenizer version changed.
+    """
+    table_name = database_filepath.replace(".db", "")
+    conn = sqlite3.connect(database_filepath)
+
+    try:
+        with conn:
+            stale = prepare_token_store(conn)
+        vocabulary = {token: token_id for token_id, token in conn.execute(f'SELECT token_id, token FROM "{VOCABULARY_TABLE}"')}
+
+        query = f'SELECT id, message FROM "{table_name}" WHERE id NOT IN (SELECT id FROM "{TOKENS_TABLE}")'
+        nr_tokenized = 0
+        for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+            chunk = chunk.drop_duplicates("id")
+            nr_vocabulary = len(vocabulary)
+            rows = []
+            for message_id, message in zip(chunk["id"], chunk["message"].fillna("")):
+                token_ids = [vocabulary.setdefault(token, len(vocabulary)) for token in analyze(message)]
+                rows.append((int(message_id), np.array(token_ids, dtype=np.int32).tobytes()))
+
+            with conn:
+                conn.executemany(f'INSERT INTO "{VOCABULARY_TABLE}" VALUES (?, ?)',
+                                 ((token_id, token) for token, token_id in vocabulary.items() if token_id >= nr_vocabulary))
+                conn.executemany(f'INSERT OR IGNORE INTO "{TOKENS_TABLE}" VALUES (?, ?)', rows)
+            nr_tokenized += len(rows)
+    finally:
+        conn.close()
+
+    return nr_tokenized, stale
+
+
+def load_stored_tokens(database_filepath):
+    """
+    Loads the stored tokens of all messages of the database.
+
+    Parameters:
+        database_filepath (str): the file name of the SQL lite database. Example: your_db_name.db.
+
+    Returns:
+        tokens (dict): the tokens of every message, keyed by the lower cased message like the CountVectorizer passes it to the tokenizer.
+    """
+    table_name = database_filepath.replace(".db", "")
+    conn = sqlite3.connect(database_filepath)
+
+    try:
+        vocabulary = [token for token, in conn.execute(f'SELECT token FROM "{VOCABULARY_TABLE}" ORDER BY token_id')]
+        rows = conn.execute(f'SELECT m.message, t.token_ids FROM "{table_name}" m JOIN "{TOKENS_TABLE}" t ON t.id = m.id')
+        return {(message or "").lower(): [vocabulary[token_id] for token_id in np.frombuffer(token_ids, dtype=np.int32)]
+                for message, token_ids in rows}
+    finally:
+        conn.close()
+
+
+class StoredTokenizer:
+    """
+    - This tokenizer returns the stored tokens of the messages of the database instead of tokenizing them again. Messages without stored tokens are tokenized.
+    - It returns the same tokens as tokenize, so it can replace it in the pipeline while training.
+      The saved model uses tokenize again (see TokenCountTfidf.set_tokenizer), so the stored tokens are not pickled with it.
+
+    Parameters:
+        tokens (dict): the stored tokens, as returned by load_stored_tokens.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def __call__(self, text):
+        tokens = self.tokens.get(text)
+        return list(tokens) if tokens is not None else tokenize(text)
@@ -0,0 +1,136 @@
+import os
+import re
+from functools import lru_cache
+
+# version of the tokens returned by tokenize. Increase it whenever the tokens change, so the tokens stored in the database are rebuilt
+TOKENIZER_VERSION = 1
+
+# folders searched for the NLTK corpora before the default NLTK locations: the folders of DR_NLTK_DATA (separated like PATH) and the nltk_data folder of the project.
+# The corpora are never downloaded at run time, see check_nltk_data.
+NLTK_DATA_PATHS = [path for path in os.environ.get("DR_NLTK_DATA", "").split(os.pathsep) if path] + \
+    [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "nltk_data")]
+
+# corpora used by the tokenizer
+NLTK_RESOURCES = ["tokenizers/punkt_tab", "corpora/stopwords", "corpora/wordnet"]
+
+# maximum number of distinct tokens whose lemma is kept in memory
+LEMMA_CACHE_SIZE = 2 ** 17
+
+# precompiled patterns for the token filters
+SPECIAL_CHARACTERS_PATTERN = re.compile(r"^[\W_]+")
+DIGIT_PATTERN = re.compile(r"\d")
+
+
+@lru_cache(maxsize=1)
+def get_nltk():
+    """
+    Imports NLTK the first time the tokenizer is used, so scripts that do not tokenize start without it, and adds NLTK_DATA_PATHS to its search path.
+
+    Returns:
+        nltk (module): the NLTK package.
+    """
+    import nltk
+
+    for path in reversed(NLTK_DATA_PATHS):
+        if path not in nltk.data.path:
+            nltk.data.path.insert(0, path)
+    return nltk
+
+
+def check_nltk_data():
+    """
+    Checks that the corpora of the tokenizer are available locally, so that a missing corpus stops a script right away instead of in the middle of the training.
+
+    Raises:
+        LookupError: if a corpus is missing, with the command to install it.
+    """
+    nltk = get_nltk()
+    missing = []
+    for resource in NLTK_RESOURCES:
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(resource)
+
+    if missing:
+        raise LookupError(
+            "The NLTK corpora {} are missing. Install them once on a machine with network access with "
+            "`python -m nltk.downloader -d nltk_data punkt_tab stopwords wordnet` and copy the nltk_data folder into the project "
+            "or point DR_NLTK_DATA to it. Searched: {}".format(", ".join(missing), ", ".join(nltk.data.path)))
+
+
+@lru_cache(maxsize=1)
+def get_word_tokenize():
+    """
+    Returns the NLTK word tokenizer, imported the first time it is needed.
+    """
+    return get_nltk().tokenize.word_tokenize
+
+
+@lru_cache(maxsize=1)
+def get_stopwords():
+    """
+    Returns the English stop words as a frozenset, so that membership tests are constant time.
+    The corpus is only read the first time the function is called.
+
+    Returns:
+        stop_words (frozenset): the NLTK English stop words.
+    """
+    return frozenset(get_nltk().corpus.stopwords.words("english"))
+
+
+@lru_cache(maxsize=1)
+def get_lemmatizer():
+    """
+    Returns a single WordNetLemmatizer instance that is shared by all calls of the tokenizer.
+
+    Returns:
+        lemmatizer (class): the WordNet lemmatizer.
+    """
+    return get_nltk().stem.WordNetLemmatizer()
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(token):
+    """
+    Lemmatizes a single token as a verb. The results are kept in a bounded LRU cache since the vocabulary of the messages is small compared to the number of tokens.
+
+    Parameters:
+        token (str): a lower case token.
+
+    Returns:
+        lemma (str): the lemmatized token.
+    """
+    return get_lemmatizer().lemmatize(token, pos='v')
+
+
+def tokenize(text):
+    """
+    - This function takes in a string, tokenizes it, removes English stop words and applies lemmatization.
+    - The result is a list of all resulting tokens.
+    - The function can be passed into a tokenizer of a sklearn transformer so that the input will the string of each row on the dataframe.
+
+    Parameters:
+        text (str): A single string or if passed into a tokenizer of a sklearn transformer it will treat the string of each row of the dataframe.
+
+    Return:
+        clean_tokens (list): A list of the resulting tokens for the passed string after the tokenization processing.
+    """
+    stop_words = get_stopwords()
+
+    #tokenize text
+    tokens = get_word_tokenize()(text)
+
+    #stop word removal
+    tokens = [tok.lower().strip() for tok in tokens if tok not in stop_words]
+
+    #lemmatization of words
+    lemmatized_tokens = [lemmatize(tok) for tok in tokens]
+
+    #remove tokens that only contain special characters
+    clean_tokens = [tok for tok in lemmatized_tokens if not SPECIAL_CHARACTERS_PATTERN.match(tok)]
+
+    #remove tokens that contain digits as they will not be relevant for this supervised learning problem
+    clean_tokens = [tok for tok in clean_tokens if not DIGIT_PATTERN.search(tok)]
+
+    return clean_tokens
@@ -1,28 +1,18 @@
 # import libraries
 ###################################################################################################################
+import os
 import sys
-import re
+import time
+import shutil
 import sqlite3
+import argparse
+import tempfile
+import numpy as np
 import pandas as pd
 
-import nltk
-nltk.download(['wordnet'])
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+from tokenizer import tokenize
 
-
-from sklearn.pipeline import Pipeline, FeatureUnion
-from sklearn.model_selection import train_test_split
-from sklearn.model_selection import GridSearchCV
-from sklearn.preprocessing import StandardScaler
-from sklearn.multioutput import MultiOutputClassifier
-from sklearn.multiclass import OneVsRestClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
-from sklearn.metrics import classification_report, make_scorer, accuracy_score, recall_score, f1_score
-
-import joblib
+# sklearn, NLTK and the custom transformers are imported by the functions that need them, so the script starts quickly (e.g. for -h)
 
 # define processing functions
 ###################################################################################################################
@@ -33,6 +23,7 @@ def load_data(database_filepath):
 
     Parameters:
         database_filepath (str): The file path to the SQL lite database name. Example: "your_database.db". It is expected that the database is located in the "data" folder.
+            It can also be the parquet file exported by process_data.py (Example: "your_database.parquet"), in which case only the message and label columns are read.
 
     Returns:
         X (dataframe): The independent variables or features. It is expected to be a single feature with text information.
@@ -40,16 +31,24 @@ def load_data(database_filepath):
         category_names (list): The list of the target variables or labels.
     """
     
-    # set up connection and query
-    database_nm = database_filepath.replace(".db", "")
-    conn = sqlite3.connect(database_filepath)
-    query = "SELECT * FROM '{}'".format(database_nm)
+    if database_filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
 
-    # load the data into a pandas df
-    df = pd.read_sql_query(query, conn)
+        # get the list of labelling columns and load only the needed columns (the labels stay uint8)
+        category_names = [col for col in pq.read_schema(database_filepath).names if col not in ["id","message","original","genre"]]
+        df = pd.read_parquet(database_filepath, columns=["message"] + category_names)
 
-    # get the list of labelling columns 
-    category_names = list(df.drop(["id","message","original","genre"], axis=1).columns)
+    else:
+        # set up connection and query
+        database_nm = database_filepath.replace(".db", "")
+        conn = sqlite3.connect(database_filepath)
+        query = "SELECT * FROM '{}'".format(database_nm)
+
+        # load the data into a pandas df
+        df = pd.read_sql_query(query, conn)
+
+        # get the list of labelling columns 
+        category_names = list(df.drop(["id","message","original","genre"], axis=1).columns)
   
     # remove any labels from the list that only have one category (1/0) 
     for col in category_names:
@@ -63,81 +62,89 @@ def load_data(database_filepath):
     return X, y, category_names
 
 
-def tokenize(text):
+def build_features(tokenizer=tokenize, tokenize_jobs=None):
     """
-    - This function takes in a string, tokenizes it, removes English stop words and applies lemmatization. 
-    - The result is a list of all resulting tokens. 
-    - The function can be passed into a tokenizer of a sklearn transformer so that the input will the string of each row on the dataframe.
+    Builds the feature extraction step shared by the grid search and the final model.
+    The messages are tokenized once and both the TF-IDF values and the token counts are derived from the same count matrix.
 
     Parameters:
-        text (str): A single string or if passed into a tokenizer of a sklearn transformer it will treat the string of each row of the dataframe.
+        tokenizer (function): the tokenizer of the messages, e.g. a StoredTokenizer that returns the tokens stored in the database.
+        tokenize_jobs (int): number of worker processes that tokenize the messages. None tokenizes in the current process.
 
-    Return:
-        clean_tokens (list): A list of the resulting tokens for the passed string after the tokenization processing.
+    returns:
+        features (class): the FeatureUnion with the text and length features.
     """
-    #tokenize text
-    tokens = word_tokenize(text)
-    
-    #stop word removal
-    tokens = [tok.lower().strip() for tok in tokens if tok not in stopwords.words("english")]
-
-    #lemmatization of words
-    lemmatizer = WordNetLemmatizer()
-    lemmatized_tokens = [lemmatizer.lemmatize(tok, pos='v') for tok in tokens]
-
-    #remove tokens that only contain special characters
-    clean_tokens = [tok for tok in lemmatized_tokens if not re.match("^[\W_]+", tok)]
-    
-    #remove tokens that contain digits as they will not be relevant for this supervised learning problem
-    clean_tokens = [tok for tok in clean_tokens if not re.search("\d", tok)]
-    
-    return clean_tokens
+    from sklearn.pipeline import Pipeline, FeatureUnion
+    from sklearn.preprocessing import StandardScaler
+    from features import WordCounter, CharacterCounter, TokenCountTfidf
+
+    return FeatureUnion([
+        ('tokens', TokenCountTfidf(tokenizer=tokenizer, n_jobs=tokenize_jobs)),
+        ('word_count', Pipeline([
+            ('count', WordCounter()),
+            ('scale', StandardScaler())
+        ])),
+        ('character_count', Pipeline([
+            ('count', CharacterCounter()),
+            ('scale', StandardScaler())
+        ]))
+    ])
 
 
-# create a class for a custom transformer to count words in a string
-class WordCounter:
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X):
-        return [[len(text.split())] for text in X]
+def split_worker_budget(n_jobs, parallel):
+    """
+    Assigns the worker budget to a single level of parallelism, so that the grid search and the per-label training never start nested worker pools.
 
+    Parameters:
+        n_jobs (int): total number of worker processes. -1 uses all cores, 1 trains serially.
+        parallel (str): "labels" trains the label models of one fit in parallel, "candidates" fits the parameter combinations and folds of the grid search in parallel.
 
-# create a for custom transformer to measure the length of a string
-class CharacterCounter:
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X):
-        return [[len(text)] for text in X]    
+    Returns:
+        search_jobs (int): n_jobs of the grid search.
+        label_jobs (int): n_jobs of the MultiOutputClassifier.
+    """
+    if n_jobs == 1:
+        return None, None
+    if parallel == "candidates":
+        return n_jobs, None
+    return None, n_jobs
 
 
-def build_model():
+def build_model(cache_dir=None, search_jobs=None, label_jobs=None, search="grid", time_budget=3600, tokenizer=tokenize, tokenize_jobs=None):
     """
     - This function builds a pipeline for a Gradient Boosting Classifier using a grid search for multiple parameter combinations and a 5-fold crossvalidation.
     - The function is particularly built for a multi-labelling problem using as features a single column containing text information. 
+    - If a cache directory is passed, the fitted features of each fold are cached there, so they are computed only once per fold and reused for every parameter combination of the classifier.
+    - Instead of the exhaustive grid search, the parameters can be searched with successive halving (all combinations are scored on a third of the messages
+      and only the best third of them on all messages) or with a randomized search that stops after a time budget.
+
+    Parameters:
+        cache_dir (str): optional directory for the feature cache. None disables the caching.
+        search_jobs (int): number of parameter combinations and folds fitted in parallel.
+        label_jobs (int): number of label models fitted in parallel within one fit.
+        search (str): "grid" (default), "halving" or "random".
+        time_budget (float): number of seconds after which the randomized search does not start new combinations.
+        tokenizer (function): the tokenizer of the messages, e.g. a StoredTokenizer that returns the tokens stored in the database.
+        tokenize_jobs (int): number of worker processes that tokenize the messages of every fit.
 
     returns:
         model (class): the pipeline to be used for fitting and predicting multiple labels.
 
     """
+    from sklearn.pipeline import Pipeline
+    from sklearn.model_selection import GridSearchCV
+    from sklearn.multioutput import MultiOutputClassifier
+    from sklearn.multiclass import OneVsRestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import make_scorer, accuracy_score, recall_score, f1_score
+    from scipy.stats import loguniform
+    from search import SuccessiveHalvingSearchCV, TimeBudgetSearchCV
 
     # build pipeline
     pipeline = Pipeline([
-        ('features', FeatureUnion([
-            ('tfidf', TfidfVectorizer(tokenizer=tokenize)),
-            ('token_count', CountVectorizer(tokenizer=tokenize)),
-            ('word_count', Pipeline([
-                ('count', WordCounter()),
-                ('scale', StandardScaler())
-            ])),
-            ('character_count', Pipeline([
-                ('count', CharacterCounter()),
-                ('scale', StandardScaler())
-            ]))
-        ])),
-        ('lr', MultiOutputClassifier(OneVsRestClassifier(LogisticRegression())))
-    ])
+        ('features', build_features(tokenizer, tokenize_jobs)),
+        ('lr', MultiOutputClassifier(OneVsRestClassifier(LogisticRegression()), n_jobs=label_jobs))
+    ], memory=cache_dir)
     
     # define parameter grid
     param_grid = {
@@ -145,8 +152,7 @@ def build_model():
         "lr__estimator__estimator__max_iter": [5000],
         "lr__estimator__estimator__solver": ['saga', 'lbfgs'],
         "lr__estimator__estimator__multi_class": ['ovr'],
-        "lr__estimator__estimator__class_weight": ['balanced'],
-        "lr__estimator__estimator__n_jobs": [-1]
+        "lr__estimator__estimator__class_weight": ['balanced']
     }
 
     # Define the scoring metrics
@@ -156,7 +162,17 @@ def build_model():
         'f1': make_scorer(f1_score, average='weighted', zero_division=1)
     }
 
-    model = GridSearchCV(pipeline, param_grid=param_grid, cv=5, scoring=scoring, return_train_score=True, refit="f1", verbose=1)
+    # successive halving and the randomized search only compute the f1 score, the metric the grid search chooses the model by
+    if search == "halving":
+        return SuccessiveHalvingSearchCV(pipeline, param_grid=param_grid, factor=3, cv=5, scoring=scoring['f1'], random_state=42, verbose=1,
+                                         n_jobs=search_jobs)
+
+    if search == "random":
+        param_distributions = dict(param_grid, lr__estimator__estimator__C=loguniform(0.5, 20))
+        return TimeBudgetSearchCV(pipeline, param_distributions=param_distributions, time_budget=time_budget, cv=5, scoring=scoring['f1'],
+                                  random_state=42, verbose=1, n_jobs=search_jobs)
+
+    model = GridSearchCV(pipeline, param_grid=param_grid, cv=5, scoring=scoring, return_train_score=True, refit="f1", verbose=1, n_jobs=search_jobs)
 
     return model
 
@@ -197,7 +213,51 @@ def evaluate_model(model, X_test, y_test, category_names):
 
     return best_params
 
-def build_final_model(best_params, X, y):
+def print_fit_times(model):
+    """
+    Prints the mean fit and score time per fold of every parameter combination of the grid search.
+    With the feature cache enabled the first combination pays for fitting the features of each fold and the following ones reuse them.
+    Successive halving also prints the number of messages a combination was scored on, the randomized search the number of folds.
+
+    Parameters:
+        model (class): the fitted grid search.
+    """
+    results = model.cv_results_
+    for i, (params, fit_time, score_time) in enumerate(zip(results["params"], results["mean_fit_time"], results["mean_score_time"])):
+        short_params = {key.split("__")[-1]: value for key, value in params.items()}
+        extra = ""
+        if "n_resources" in results:
+            extra = f"  messages {results['n_resources'][i]:6d}"
+        elif "n_folds" in results:
+            extra = f"  folds {results['n_folds'][i]}"
+        print(f"    fit {fit_time:8.2f}s  score {score_time:8.2f}s{extra}  {short_params}")
+
+
+def print_search_parity(searches, X_test, y_test):
+    """
+    Compares parameter searches with the full grid search: the wall time, the number of scored parameter combinations,
+    the best cross-validation f1 score and the weighted f1 score of the chosen parameters on the held out messages.
+
+    Parameters:
+        searches (list): tuples of the name, the fitted search and its wall time in seconds. The last one is the full grid search.
+        X_test (dataframe): the held out messages.
+        y_test (dataframe): the labels of the held out messages.
+    """
+    from sklearn.metrics import f1_score
+
+    rows = []
+    for name, search, seconds in searches:
+        test_f1 = f1_score(y_test, search.predict(X_test), average='weighted', zero_division=1)
+        rows.append((name, seconds, len(search.cv_results_["params"]), search.best_score_, test_f1, search.best_params_))
+
+    grid_seconds, grid_test_f1 = rows[-1][1], rows[-1][4]
+    print(f"    {'search':8s} {'wall time':>10s} {'speedup':>8s} {'scored':>7s} {'cv f1':>7s} {'test f1':>8s} {'vs grid':>8s}  best parameters")
+    for name, seconds, nr_scored, cv_f1, test_f1, best_params in rows:
+        short_params = {key.split("__")[-1]: value for key, value in best_params.items() if key.endswith(("__C", "__solver"))}
+        print(f"    {name:8s} {seconds:9.1f}s {grid_seconds / seconds:7.2f}x {nr_scored:7d} {cv_f1:7.4f} {test_f1:8.4f} {test_f1 - grid_test_f1:+8.4f}  {short_params}")
+
+
+def build_final_model(best_params, X, y, n_jobs=None, tokenizer=tokenize, tokenize_jobs=None):
     """
     Builds and fits the final model using the whole dataset and the best paramaters found using GridSearchCV.
 
@@ -205,10 +265,17 @@ def build_final_model(best_params, X, y):
         best_params (dict): the best parameters for the best model       
         X_test (dataframe): the whole dataframe containing the features.
         y_test (dataframe): the whole dataframe containing the labelling columns.
+        n_jobs (int): number of label models fitted in parallel.
+        tokenizer (function): the tokenizer used for the fit. The saved model always tokenizes new messages with tokenize.
+        tokenize_jobs (int): number of worker processes that tokenize the messages for the fit. The saved model tokenizes in the current process.
 
     returns:
         final_model (class): the fitted final model using the whole dataset.      
     """
+    from sklearn.pipeline import Pipeline
+    from sklearn.multioutput import MultiOutputClassifier
+    from sklearn.multiclass import OneVsRestClassifier
+    from sklearn.linear_model import LogisticRegression
 
     # extract parameters
     def extract_best_params(best_params):
@@ -229,70 +296,417 @@ def build_final_model(best_params, X, y):
 
     # build the model with extracted parameters
     final_model = Pipeline([
-        ('features', FeatureUnion([
-            ('tfidf', TfidfVectorizer(tokenizer=tokenize)),
-            ('token_count', CountVectorizer(tokenizer=tokenize)),
-            ('word_count', Pipeline([
-                ('count', WordCounter()),
-                ('scale', StandardScaler())
-            ])),
-            ('character_count', Pipeline([
-                ('count', CharacterCounter()),
-                ('scale', StandardScaler())
-            ]))
-        ])),
-        ('lr', MultiOutputClassifier(OneVsRestClassifier(LogisticRegression(C=C, max_iter=max_iter, solver=solver, multi_class=multi_class, class_weight=class_weight, n_jobs=-1))))
+        ('features', build_features(tokenizer, tokenize_jobs)),
+        ('lr', MultiOutputClassifier(OneVsRestClassifier(LogisticRegression(C=C, max_iter=max_iter, solver=solver, multi_class=multi_class, class_weight=class_weight)), n_jobs=n_jobs))
     ])
 
     # fit the model using the whole dataset
     final_model.fit(X, y)
 
+    # predict serially, starting a worker pool for every request would only slow the web app down
+    final_model.set_params(lr__n_jobs=None, features__tokens__n_jobs=None)
+
+    # new messages have no stored tokens, the saved model tokenizes them itself
+    dict(final_model.named_steps['features'].transformer_list)['tokens'].set_tokenizer(tokenize)
+
     return final_model
 
 
+def get_max_id(database_filepath):
+    """
+    Returns the highest message id of the SQL lite database (or the parquet file). It is saved with the model as training watermark,
+    so update_classifier.py knows which messages were added after the training.
+
+    Parameters:
+        database_filepath (str): The file path to the SQL lite database or the parquet file.
+
+    Returns:
+        max_id (int): the highest message id.
+    """
+    if database_filepath.endswith(".parquet"):
+        return int(pd.read_parquet(database_filepath, columns=["id"])["id"].max())
+
+    conn = sqlite3.connect(database_filepath)
+    try:
+        return int(conn.execute("SELECT MAX(id) FROM '{}'".format(database_filepath.replace(".db", ""))).fetchone()[0])
+    finally:
+        conn.close()
+
+
+def iterate_chunks(database_filepath, chunksize):
+    """
+    Reads the table of the SQL lite database (or the parquet file exported by process_data.py) in chunks, so only one chunk is in memory at a time.
+
+    Parameters:
+        database_filepath (str): The file path to the SQL lite database or the parquet file.
+        chunksize (int): the maximum number of rows per chunk.
+
+    Returns:
+        chunks (generator): the rows as pandas dataframes.
+    """
+    if database_filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(database_filepath).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+
+    else:
+        database_nm = database_filepath.replace(".db", "")
+        conn = sqlite3.connect(database_filepath)
+        try:
+            for chunk in pd.read_sql_query("SELECT * FROM '{}'".format(database_nm), conn, chunksize=chunksize):
+                yield chunk
+        finally:
+            conn.close()
+
+
+def count_label_errors(y_test, y_pred):
+    """
+    Counts the true positives, false positives and false negatives of every label and sums the scores of every message,
+    so the evaluation can be accumulated chunk by chunk instead of keeping all labels and predictions in memory.
+
+    Parameters:
+        y_test (array): the true labels (0/1) of a chunk.
+        y_pred (array): the predicted labels (0/1) of the chunk.
+
+    Returns:
+        counts (array): array of shape (3, number of labels) with the true positives, false positives and false negatives.
+        sample_scores (array): the sums of the precision, recall and f1 score of the messages (zero_division=1 like the classification report).
+    """
+    y_test, y_pred = np.asarray(y_test, dtype=bool), np.asarray(y_pred, dtype=bool)
+    true_positives, false_positives, false_negatives = y_test & y_pred, ~y_test & y_pred, y_test & ~y_pred
+    counts = np.vstack([true_positives.sum(axis=0), false_positives.sum(axis=0), false_negatives.sum(axis=0)])
+
+    sample_scores = np.array([score.sum() for score in
+                              precision_recall_f1(true_positives.sum(axis=1), false_positives.sum(axis=1), false_negatives.sum(axis=1))])
+    return counts, sample_scores
+
+
+def precision_recall_f1(tp, fp, fn):
+    """
+    Returns the precision, recall and f1 score for the counts of true positives, false positives and false negatives,
+    with 1 for an undefined score like zero_division=1.
+    """
+    precision = np.where(tp + fp > 0, tp / np.maximum(tp + fp, 1), 1.0)
+    recall = np.where(tp + fn > 0, tp / np.maximum(tp + fn, 1), 1.0)
+    f1 = np.where(2 * tp + fp + fn > 0, 2 * tp / np.maximum(2 * tp + fp + fn, 1), 1.0)
+    return precision, recall, f1
+
+
+def report_from_counts(counts, sample_scores, nr_rows, category_names):
+    """
+    Builds the text of classification_report(..., zero_division=1) from the counts of count_label_errors.
+
+    Parameters:
+        counts (array): the summed true positives, false positives and false negatives of every label.
+        sample_scores (array): the summed precision, recall and f1 scores of the messages.
+        nr_rows (int): number of evaluated messages.
+        category_names (list): the names of the labels.
+
+    Returns:
+        report (str): the report with the precision, recall, f1 score and support of every label and the averages.
+    """
+    tp, fp, fn = counts
+    support = tp + fn
+    precision, recall, f1 = precision_recall_f1(tp, fp, fn)
+    micro = precision_recall_f1(tp.sum(), fp.sum(), fn.sum())
+    weights = support / support.sum() if support.sum() else np.zeros(len(support))
+
+    width = max(len(name) for name in category_names + ["weighted avg"])
+    lines = ['{:>{}s}  {:>9s} {:>9s} {:>9s} {:>9s}'.format('', width, 'precision', 'recall', 'f1-score', 'support'), '']
+    for name, values in zip(category_names, zip(precision, recall, f1, support)):
+        lines.append('{:>{}s}  {:>9.2f} {:>9.2f} {:>9.2f} {:>9d}'.format(name, width, *values))
+    lines.append('')
+    for name, values in [('micro avg', [float(score) for score in micro]),
+                         ('macro avg', [precision.mean(), recall.mean(), f1.mean()]),
+                         ('weighted avg', [precision @ weights, recall @ weights, f1 @ weights]),
+                         ('samples avg', sample_scores / max(nr_rows, 1))]:
+        lines.append('{:>{}s}  {:>9.2f} {:>9.2f} {:>9.2f} {:>9d}'.format(name, width, *values, int(support.sum())))
+    return "\n".join(lines) + "\n"
+
+
+def train_out_of_core(database_filepath, chunksize=10000, n_features=2 ** 17, n_epochs=1):
+    """
+    - This function trains a model over the database in chunks, so the memory use does not depend on the number of messages.
+    - The features are hashed (HashingFeatures) and every label gets a logistic regression trained with stochastic gradient descent (SGDClassifier), which supports partial_fit.
+    - Rows with id % 10 < 3 (about 30%) are held out to evaluate the model and are then added to the training, like the final model which is fitted on the whole dataset.
+      The features (idf and scalers) are fitted on the training rows only, so the evaluation does not see the held out messages.
+    - The evaluation accumulates the errors of every label chunk by chunk (count_label_errors), so it needs no more memory than a chunk.
+
+    Parameters:
+        database_filepath (str): The file path to the SQL lite database or the parquet file.
+        chunksize (int): number of rows read at a time.
+        n_features (int): number of hash buckets of the token features.
+        n_epochs (int): number of passes over the training rows.
+
+    returns:
+        model (class): the fitted pipeline with a MultiLabelLinearClassifier that stores the weights as a sparse matrix.
+    """
+    from sklearn.pipeline import Pipeline
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.metrics import classification_report
+    from features import HashingFeatures
+    from linear import MultiLabelLinearClassifier
+
+    features = HashingFeatures(n_features=n_features, tokenizer=tokenize)
+
+    # first pass: fit the features on the training rows and count the labels
+    label_cols, label_sums, nr_rows = None, None, 0
+    for chunk in iterate_chunks(database_filepath, chunksize):
+        if label_cols is None:
+            label_cols = [col for col in chunk.columns if col not in ["id","message","original","genre"]]
+            label_sums = np.zeros(len(label_cols))
+        train_chunk = chunk[chunk["id"] % 10 >= 3]
+        if len(train_chunk):
+            features.partial_fit(train_chunk["message"])
+        label_sums += chunk[label_cols].to_numpy().sum(axis=0)
+        nr_rows += len(chunk)
+    print('    {} messages, {} hashed token features'.format(nr_rows, n_features))
+
+    # remove any labels that only have one category (1/0) and weight the classes like class_weight='balanced'
+    keep = (label_sums > 0) & (label_sums < nr_rows)
+    category_names = [col for col, keep_label in zip(label_cols, keep) if keep_label]
+    estimators = [
+        SGDClassifier(loss='log_loss', class_weight={0: nr_rows / (2 * (nr_rows - positives)), 1: nr_rows / (2 * positives)}, random_state=42)
+        for positives in label_sums[keep]
+    ]
+
+    def transform_chunks(test):
+        for chunk in iterate_chunks(database_filepath, chunksize):
+            chunk = chunk[(chunk["id"] % 10 < 3) == test]
+            if len(chunk):
+                yield features.transform(chunk["message"]), chunk[category_names].to_numpy()
+
+    def partial_fit(X, y):
+        for i, estimator in enumerate(estimators):
+            estimator.partial_fit(X, y[:, i], classes=[0, 1])
+
+    # train on the training rows
+    for epoch in range(n_epochs):
+        for X, y in transform_chunks(test=False):
+            partial_fit(X, y)
+        print('    epoch {} done'.format(epoch + 1))
+
+    # the unfitted estimator is stored as the parameter of the classifier, like MultiOutputClassifier(estimator) does
+    estimator = SGDClassifier(loss='log_loss', random_state=42)
+
+    # evaluate on the held out rows
+    classifier = MultiLabelLinearClassifier.from_estimators(estimators, estimator=estimator)
+    counts, sample_scores, nr_test = np.zeros((3, len(category_names)), dtype=np.int64), np.zeros(3), 0
+    for X, y in transform_chunks(test=True):
+        chunk_counts, chunk_scores = count_label_errors(y, classifier.predict(X))
+        counts += chunk_counts
+        sample_scores += chunk_scores
+        nr_test += len(y)
+    if nr_test:
+        print(f"Overall accuracy: {1 - counts[1:].sum() / (nr_test * len(category_names))}")
+        print(report_from_counts(counts, sample_scores, nr_test, category_names))
+
+    # add the held out rows to the training
+    for X, y in transform_chunks(test=True):
+        partial_fit(X, y)
+
+    classifier = MultiLabelLinearClassifier.from_estimators(estimators, estimator=estimator).sparsify()
+    model = Pipeline([('features', features), ('lr', classifier)])
+    model.category_names_ = category_names
+
+    return model
+
+
 def save_model(model, model_filepath):
     """
     Exports the model as a pickle file in the passed file path.
+    The file is not compressed, so that the web app can memory map the arrays of the model and share them between its workers.
+    The model is written to a temporary file in the same directory, which then replaces the file in one rename, so the web app
+    (which reloads a changed model file) never reads a half-written model and an interrupted run keeps the previous model.
 
     Parameters:
         model (class): the fitted final model.
         model_filepath (str): a string containing the directory and name of the pickle file.
 
     """
-    joblib.dump(model, model_filepath)
+    import joblib
+
+    directory = os.path.dirname(os.path.abspath(model_filepath))
+    file_descriptor, temp_filepath = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(model_filepath)), suffix=".tmp", dir=directory)
+    os.close(file_descriptor)
+    try:
+        joblib.dump(model, temp_filepath)
+        # mkstemp creates the file readable by its owner only, the model keeps the permissions of a normally created file
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_filepath, 0o666 & ~umask)
+        os.replace(temp_filepath, model_filepath)
+    except BaseException:
+        os.remove(temp_filepath)
+        raise
 
 
 # define main function
 ###################################################################################################################
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Trains the disaster messages classifier and saves it as a pickle file.',
+        epilog='Example: python train_classifier.py DisasterResponse.db classifier.pkl --cache-features')
+    parser.add_argument('database_filepath', help='filepath of the disaster messages database')
+    parser.add_argument('model_filepath', help='filepath of the pickle file to save the model to')
+    parser.add_argument('--cache-features', nargs='?', const='', default=None, metavar='CACHE_DIR',
+                        help='fit the features only once per fold and reuse them for every parameter combination. '
+                             'The cache is kept in CACHE_DIR or, if no directory is given, in a temporary directory that is removed after training.')
+    parser.add_argument('--n-jobs', type=int, default=1,
+                        help='total number of worker processes used for training (default 1, -1 uses all cores)')
+    parser.add_argument('--parallel', choices=['labels', 'candidates'], default='labels',
+                        help='what the workers run in parallel: the label models of each fit (default) or the parameter combinations and folds of the grid search. '
+                             'The final model always trains its label models in parallel.')
+    parser.add_argument('--model-type', choices=['multioutput', 'linear'], default='multioutput',
+                        help='type of the saved classifier: one estimator per label (default) or all label weights in one matrix, '
+                             'which predicts the same labels with a single matrix multiplication')
+    parser.add_argument('--out-of-core', action='store_true',
+                        help='train over the database in chunks with hashed features and SGD logistic regressions instead of the grid search, '
+                             'so the memory use and the size of the model do not grow with the number of messages')
+    parser.add_argument('--chunksize', type=int, default=10000, help='number of rows read at a time with --out-of-core (default 10000)')
+    parser.add_argument('--n-features', type=int, default=2 ** 17, help='number of hash buckets of the token features with --out-of-core (default 2**17)')
+    parser.add_argument('--epochs', type=int, default=1, help='number of passes over the training rows with --out-of-core (default 1)')
+    parser.add_argument('--search', choices=['grid', 'halving', 'random'], default='grid',
+                        help='parameter search: the exhaustive grid (default), successive halving on the number of messages, '
+                             'or a randomized search that stops after --time-budget seconds')
+    parser.add_argument('--time-budget', type=float, default=3600, help='seconds after which --search random starts no new combination (default 3600)')
+    parser.add_argument('--compare-grid', action='store_true',
+                        help='also run the full grid search after --search halving/random and compare the wall time and the scores of both')
+    parser.add_argument('--stored-tokens', action='store_true',
+                        help='use the tokens stored in the database by process_data.py --tokens instead of tokenizing the messages in every fit. '
+                             'Messages without stored tokens and tokens of an older tokenizer version are (re)built and stored first.')
+    parser.add_argument('--tokenize-jobs', type=int, default=1,
+                        help='number of worker processes that tokenize the messages of every fit (default 1, -1 uses all cores). '
+                             'The saved model tokenizes in the current process.')
+    parser.add_argument('--gate', choices=['related', 'aid_related'], default=None,
+                        help='predict the other labels only for messages whose probability of this label reaches --gate-threshold, '
+                             'the other messages only get the gate label (see benchmarks/benchmark_gate.py for the throughput and recall)')
+    parser.add_argument('--gate-threshold', type=float, default=0.5, help='minimum probability of the gate label with --gate (default 0.5)')
+    args = parser.parse_args()
+    if args.tokenize_jobs == 0 or args.tokenize_jobs < -1:
+        parser.error('--tokenize-jobs must be a positive number or -1')
+    if args.tokenize_jobs != 1 and (args.stored_tokens or args.out_of_core):
+        parser.error('--tokenize-jobs cannot be used with --stored-tokens or --out-of-core')
+    if args.tokenize_jobs != 1 and args.parallel == 'candidates' and args.n_jobs != 1:
+        parser.error('--tokenize-jobs cannot be used with --parallel candidates, every candidate would start its own tokenizer pool')
+    return args
+
+
 def main():
-    if len(sys.argv) == 3:
-        database_filepath, model_filepath = sys.argv[1:]
+    args = parse_args()
+    database_filepath, model_filepath = args.database_filepath, args.model_filepath
+
+    from tokenizer import check_nltk_data
+    from sklearn.model_selection import train_test_split
+    from linear import convert_pipeline
+    from gate import gate_pipeline
+    from token_store import update_token_store, load_stored_tokens, StoredTokenizer
+
+    # the corpora are read from the local NLTK data folders (DR_NLTK_DATA or nltk_data of the project), they are never downloaded here
+    try:
+        check_nltk_data()
+    except LookupError as error:
+        sys.exit(str(error))
+
+    if args.stored_tokens and (args.out_of_core or not database_filepath.endswith('.db')):
+        sys.exit('--stored-tokens needs a SQL lite database and cannot be used with --out-of-core.')
+
+    if args.out_of_core:
+        print('Training model out of core...\n    DATABASE: {}\n    CHUNK SIZE: {}'.format(database_filepath, args.chunksize))
+        start = time.perf_counter()
+        final_model = train_out_of_core(database_filepath, args.chunksize, args.n_features, args.epochs)
+        final_model.max_trained_id_ = get_max_id(database_filepath)
+        print('Training took {:.1f}s.'.format(time.perf_counter() - start))
+
+        if args.gate:
+            print('Adding the {} gate (threshold {})...'.format(args.gate, args.gate_threshold))
+            final_model = gate_pipeline(final_model, final_model.category_names_, args.gate, args.gate_threshold)
+
+        print('Saving model...\n    MODEL: {}'.format(model_filepath))
+        save_model(final_model, model_filepath)
+
+        print('Trained model saved!')
+        return
+
+    # set up the feature cache
+    cache_dir = args.cache_features or None
+    temporary_cache = args.cache_features == ''
+    if temporary_cache:
+        cache_dir = tempfile.mkdtemp(prefix='dr_features_')
+
+    try:
         print('Loading data...\n    DATABASE: {}'.format(database_filepath))
         X, y, category_names = load_data(database_filepath)
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+
+        tokenizer = tokenize
+        if args.stored_tokens:
+            print('Loading stored tokens...')
+            nr_tokenized, stale = update_token_store(database_filepath)
+            if stale:
+                print('    the stored tokens were created by another tokenizer version and were rebuilt')
+            print('    {} messages tokenized and stored'.format(nr_tokenized))
+            tokenizer = StoredTokenizer(load_stored_tokens(database_filepath))
         
         print('Building model...')
-        model = build_model()
+        search_jobs, label_jobs = split_worker_budget(args.n_jobs, args.parallel)
+        tokenize_jobs = None if args.tokenize_jobs == 1 else args.tokenize_jobs
+        model = build_model(cache_dir=cache_dir, search_jobs=search_jobs, label_jobs=label_jobs, search=args.search, time_budget=args.time_budget,
+                            tokenizer=tokenizer, tokenize_jobs=tokenize_jobs)
         
-        print('Training model...')
+        print('Training model...\n    WORKERS: {} ({})\n    TOKENIZER WORKERS: {}\n    SEARCH: {}'
+              .format(args.n_jobs, args.parallel if args.n_jobs != 1 else 'serial', args.tokenize_jobs, args.search))
+        if cache_dir:
+            print('    FEATURE CACHE: {}'.format(cache_dir))
+        start = time.perf_counter()
         model.fit(X_train, y_train)
+        search_seconds = time.perf_counter() - start
+        print('Parameter search took {:.1f}s. Mean time per fold of each parameter combination:'.format(search_seconds))
+        print_fit_times(model)
+
+        if args.compare_grid and args.search != 'grid':
+            print('Running the full grid search for comparison...')
+            grid = build_model(cache_dir=cache_dir, search_jobs=search_jobs, label_jobs=label_jobs, tokenizer=tokenizer, tokenize_jobs=tokenize_jobs)
+            start = time.perf_counter()
+            grid.fit(X_train, y_train)
+            print_search_parity([(args.search, model, search_seconds), ('grid', grid, time.perf_counter() - start)], X_test, y_test)
         
         print('Evaluating model...')
         best_params = evaluate_model(model, X_test, y_test, category_names)
 
         print('Building final model with best parameters...')
-        final_model = build_final_model(best_params, X, y)
+        start = time.perf_counter()
+        final_model = build_final_model(best_params, X, y, n_jobs=None if args.n_jobs == 1 else args.n_jobs, tokenizer=tokenizer,
+                                        tokenize_jobs=tokenize_jobs)
+        print('Final model took {:.1f}s.'.format(time.perf_counter() - start))
+
+        if args.model_type == 'linear':
+            print('Converting final model to a single weight matrix...')
+            final_model = convert_pipeline(final_model)
+
+        if args.gate:
+            print('Adding the {} gate (threshold {})...'.format(args.gate, args.gate_threshold))
+            final_model = gate_pipeline(final_model, category_names, args.gate, args.gate_threshold)
+
+        # keep the label order and the training watermark with the model for update_classifier.py
+        final_model.category_names_ = category_names
+        final_model.max_trained_id_ = get_max_id(database_filepath)
 
         print('Saving model...\n    MODEL: {}'.format(model_filepath))
         save_model(final_model, model_filepath)
 
         print('Trained model saved!')
 
-    else:
-        print('Please provide the filepath of the disaster messages database '\
-              'as the first argument and the filepath of the pickle file to '\
-              'save the model to as the second argument. \n\nExample: python '\
-              'train_classifier.py DisasterResponse.db classifier.pkl')
+    finally:
+        if temporary_cache:
+            shutil.rmtree(cache_dir, ignore_errors=True)
 
 
 # run the code
@@ -0,0 +1,233 @@
+# import libraries
+###################################################################################################################
+import os
+import time
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+
+from sklearn.metrics import f1_score
+
+import joblib
+
+# the tokenizer and the custom transformers are imported so that models pickled from the training script's __main__ can be loaded
+from tokenizer import tokenize
+from features import WordCounter, CharacterCounter
+from linear import convert_pipeline
+from train_classifier import load_data, save_model
+
+# define functions
+###################################################################################################################
+def load_new_data(database_filepath, since_id, category_names):
+    """
+    Loads only the messages that were added after the training watermark of the model.
+
+    Parameters:
+        database_filepath (str): The file path to the SQL lite database or the parquet file exported by process_data.py.
+        since_id (int): the highest message id the model was trained on.
+        category_names (list): the labels in the order the model predicts them.
+
+    Returns:
+        df (dataframe): the id, message and label columns of the new messages.
+    """
+    columns = ["id", "message"] + category_names
+
+    if database_filepath.endswith(".parquet"):
+        return pd.read_parquet(database_filepath, columns=columns, filters=[("id", ">", since_id)])
+
+    conn = sqlite3.connect(database_filepath)
+    try:
+        query = "SELECT {} FROM '{}' WHERE id > ? ORDER BY id".format(", ".join(f'"{col}"' for col in columns), database_filepath.replace(".db", ""))
+        return pd.read_sql_query(query, conn, params=(since_id,))
+    finally:
+        conn.close()
+
+
+def balanced_weights(y):
+    """
+    Weights the messages of every label like class_weight='balanced', so the rare positive labels are not ignored by the update.
+
+    Parameters:
+        y (array): the labels (0/1), one column per label.
+
+    Returns:
+        sample_weight (array): weights with the same shape as y.
+    """
+    positives = y.sum(axis=0)
+    negatives = len(y) - positives
+    positive_weight = np.where(positives > 0, len(y) / (2 * np.maximum(positives, 1)), 1.0)
+    negative_weight = np.where(negatives > 0, len(y) / (2 * np.maximum(negatives, 1)), 1.0)
+    return y * positive_weight + (1 - y) * negative_weight
+
+
+def update_model(model, X, y, n_epochs=5, batch_size=256, learning_rate=0.01):
+    """
+    Updates the classifier weights of the model with the new messages, keeping the fitted features as they are.
+
+    Parameters:
+        model (class): the fitted pipeline. A MultiOutputClassifier is converted to the equivalent MultiLabelLinearClassifier first.
+        X (series): the new messages.
+        y (array): the labels of the new messages.
+        n_epochs (int): number of passes over the new messages.
+        batch_size (int): number of messages per gradient step.
+        learning_rate (float): size of the gradient steps.
+
+    Returns:
+        model (class): the updated pipeline.
+    """
+    # the classifier is converted or copied, so the original model can still be scored after the update
+    model = convert_pipeline(model)
+
+    features = model[:-1].transform(X)
+    sample_weight = balanced_weights(y)
+    random_state = np.random.RandomState(42)
+
+    for epoch in range(n_epochs):
+        order = random_state.permutation(len(y))
+        for start in range(0, len(y), batch_size):
+            batch = order[start:start + batch_size]
+            model[-1].partial_fit(features[batch], y[batch], sample_weight=sample_weight[batch], learning_rate=learning_rate)
+
+    return model
+
+
+def split_holdout(n_messages, min_holdout):
+    """
+    Holds out every fifth new message (by position in id order) to check the update. The split does not depend on the values of the ids,
+    so both parts are filled whenever there are at least five new messages.
+
+    Parameters:
+        n_messages (int): number of new messages.
+        min_holdout (int): minimum number of held out messages needed to check the update.
+
+    Returns:
+        holdout (array): True for the held out messages.
+
+    Raises:
+        ValueError: if fewer than min_holdout messages would be held out.
+    """
+    holdout = np.arange(n_messages) % 5 == 4
+    if holdout.sum() < max(min_holdout, 1):
+        raise ValueError('Only {} of the {} new messages would be held out, at least {} are needed to check the update '
+                         '(lower --min-holdout or skip the check with --no-check).'.format(holdout.sum(), n_messages, max(min_holdout, 1)))
+    return holdout
+
+
+def default_output_filepath(model_filepath):
+    """
+    Returns the file the updated model is saved to by default: next to the trained model, e.g. dr_classifier.updated.pkl,
+    so the model used by the web app is only replaced on request (--in-place).
+    """
+    root, extension = os.path.splitext(model_filepath)
+    return "{}.updated{}".format(root, extension or ".pkl")
+
+
+def score_model(model, X, y):
+    """
+    Returns the weighted f1 score of the model, the metric used to choose the model in train_classifier.py.
+    """
+    return f1_score(y, np.asarray(model.predict(X)), average='weighted', zero_division=1)
+
+
+def parse_args():
+    """
+    Parses the command line arguments of the script.
+
+    Returns:
+        args (namespace): the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Updates a trained model with the messages added to the database after its training, without a full retraining.',
+        epilog='Example: python update_classifier.py DisasterResponse.db classifier.pkl')
+    parser.add_argument('database_filepath', help='filepath of the disaster messages database (or parquet file)')
+    parser.add_argument('model_filepath', help='filepath of the trained model')
+    parser.add_argument('--output', default=None,
+                        help='filepath to save the updated model to (default: next to the trained model, e.g. dr_classifier.updated.pkl)')
+    parser.add_argument('--in-place', action='store_true', help='replace the trained model with the updated one (the file is replaced in one rename)')
+    parser.add_argument('--since-id', type=int, default=None,
+                        help='only use messages with a higher id (default: the training watermark saved with the model)')
+    parser.add_argument('--epochs', type=int, default=5, help='number of passes over the new messages (default 5)')
+    parser.add_argument('--learning-rate', type=float, default=0.01, help='size of the gradient steps (default 0.01)')
+    parser.add_argument('--tolerance', type=float, default=0.0,
+                        help='maximum allowed decrease of the weighted f1 score on the held out messages (default 0.0)')
+    parser.add_argument('--min-holdout', type=int, default=50,
+                        help='minimum number of held out messages needed to check the update (default 50)')
+    parser.add_argument('--no-check', action='store_true',
+                        help='update the model with all new messages without holding any out, the update is saved unchecked')
+    args = parser.parse_args()
+
+    if args.output and args.in_place:
+        parser.error('--output and --in-place can not be combined')
+    if args.min_holdout < 1:
+        parser.error('--min-holdout must be a positive number, use --no-check to skip the check')
+    return args
+
+
+# define main function
+###################################################################################################################
+def main():
+    args = parse_args()
+    output_filepath = args.model_filepath if args.in_place else args.output or default_output_filepath(args.model_filepath)
+
+    print('Loading model...\n    MODEL: {}'.format(args.model_filepath))
+    model = joblib.load(args.model_filepath)
+
+    since_id = args.since_id if args.since_id is not None else getattr(model, 'max_trained_id_', None)
+    if since_id is None:
+        print('The model has no training watermark, please pass the highest id it was trained on with --since-id.')
+        return
+
+    category_names = getattr(model, 'category_names_', None)
+    if category_names is None:
+        _, _, category_names = load_data(args.database_filepath)
+
+    print('Loading new messages...\n    DATABASE: {}\n    SINCE ID: {}'.format(args.database_filepath, since_id))
+    df = load_new_data(args.database_filepath, since_id, category_names)
+    if len(df) == 0:
+        print('No new messages, the model is up to date.')
+        return
+
+    # hold out every fifth new message to check the update
+    if args.no_check:
+        holdout = np.zeros(len(df), dtype=bool)
+    else:
+        try:
+            holdout = split_holdout(len(df), args.min_holdout)
+        except ValueError as error:
+            print(error)
+            raise SystemExit(1)
+    X, y = df["message"].reset_index(drop=True), df[category_names].to_numpy()
+    print('    {} new messages, {} held out'.format(len(df), holdout.sum()))
+
+    print('Updating model...')
+    start = time.perf_counter()
+    updated_model = update_model(model, X[~holdout], y[~holdout], n_epochs=args.epochs, learning_rate=args.learning_rate)
+    print('Update took {:.1f}s.'.format(time.perf_counter() - start))
+
+    if holdout.any():
+        old_score = score_model(model, X[holdout], y[holdout])
+        new_score = score_model(updated_model, X[holdout], y[holdout])
+        print('Weighted f1 score on the held out messages: {:.4f} before, {:.4f} after the update'.format(old_score, new_score))
+        if new_score < old_score - args.tolerance:
+            print('The update made the model worse, it was not saved.')
+            raise SystemExit(1)
+
+        # learn from the held out messages as well, now that the update was accepted
+        updated_model = update_model(updated_model, X[holdout], y[holdout], n_epochs=args.epochs, learning_rate=args.learning_rate)
+    else:
+        print('No held out messages (--no-check), the update was not checked.')
+
+    updated_model.category_names_ = category_names
+    updated_model.max_trained_id_ = int(df["id"].max())
+
+    print('Saving model...\n    MODEL: {}'.format(output_filepath))
+    save_model(updated_model, output_filepath)
+
+    print('Updated model saved!')
+
+
+# run the code
+###################################################################################################################
+if __name__ == '__main__':
+    main()